@@ -0,0 +1,94 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+
+import pytest
+
+import pgdata
+
+
+ROWS = int(os.environ.get("PGDATA_BENCH_ROWS", 100000))
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(("localhost", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+@pytest.fixture(scope="session")
+def url():
+    """
+    Database to benchmark against: PGDATA_BENCH_URL if set, otherwise a
+    throwaway cluster created with the initdb/pg_ctl found on the PATH
+    """
+    if os.environ.get("PGDATA_BENCH_URL"):
+        yield os.environ["PGDATA_BENCH_URL"]
+        return
+    if not shutil.which("initdb") or not shutil.which("pg_ctl"):
+        pytest.skip("set PGDATA_BENCH_URL or put initdb and pg_ctl on the PATH")
+    tempdir = tempfile.mkdtemp(prefix="pgdata_bench_")
+    datadir = os.path.join(tempdir, "data")
+    port = _free_port()
+    subprocess.run(
+        ["initdb", "-D", datadir, "-U", "postgres", "-A", "trust"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [
+            "pg_ctl",
+            "-D",
+            datadir,
+            "-l",
+            os.path.join(tempdir, "postgres.log"),
+            "-o",
+            "-p {} -k {} -c fsync=off".format(port, tempdir),
+            "-w",
+            "start",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        url = "postgresql://postgres@localhost:{}/pgdata_bench".format(port)
+        pgdata.create_db(url)
+        yield url
+    finally:
+        subprocess.run(["pg_ctl", "-D", datadir, "-m", "immediate", "stop"])
+        shutil.rmtree(tempdir)
+
+
+@pytest.fixture(scope="session")
+def db(url):
+    db = pgdata.connect(url, schema="bench")
+    db.create_schema("bench")
+    try:
+        db.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    except Exception:
+        pass
+    return db
+
+
+@pytest.fixture(scope="session")
+def has_postgis(db):
+    return db.query_one("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+
+
+@pytest.fixture(scope="session")
+def big_table(db):
+    """A table of ROWS rows, with a primary key"""
+    db.execute("DROP TABLE IF EXISTS bench.big")
+    db.execute(
+        """CREATE TABLE bench.big AS
+           SELECT i AS id, md5(i::text) AS name, random() AS value
+           FROM generate_series(1, %s) AS i""",
+        (ROWS,),
+    )
+    db.execute("ALTER TABLE bench.big ADD PRIMARY KEY (id)")
+    db.execute("ANALYZE bench.big")
+    return db["big"]
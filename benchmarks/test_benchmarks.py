@@ -0,0 +1,139 @@
+"""
+Benchmarks of pgdata hot paths, run with pytest-benchmark:
+
+    pytest benchmarks --benchmark-json=bench.json
+
+and compare runs with ``pytest-benchmark compare``.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import Float, Integer, UnicodeText
+from sqlalchemy.schema import Column
+
+from pgdata import Table
+from pgdata.util import RECORD, ResultIter, row_type as default_row_type
+
+from conftest import ROWS
+
+
+def _rows(n):
+    return [{"id": i, "name": "name %s" % i, "value": i / 3.0} for i in range(n)]
+
+
+@pytest.fixture
+def empty_table(db):
+    columns = [
+        Column("id", Integer, primary_key=True),
+        Column("name", UnicodeText),
+        Column("value", Float),
+    ]
+    db["bench.load"].drop()
+    table = db.create_table("load", columns)
+    yield table
+    table.drop()
+
+
+@pytest.mark.parametrize("method", ["insert", "copy"])
+@pytest.mark.parametrize("chunk_size", [100, 1000, 10000])
+def test_insert_many(benchmark, db, empty_table, method, chunk_size):
+    rows = _rows(20000)
+
+    def load():
+        db.execute("TRUNCATE bench.load")
+        empty_table.insert_many(rows, chunk_size=chunk_size, method=method)
+
+    benchmark.pedantic(load, rounds=3)
+
+
+@pytest.mark.parametrize("keyset", [True, False])
+def test_find_deep_paging(benchmark, big_table, keyset):
+    def page():
+        return sum(1 for _ in big_table.find(_step=5000, _keyset=keyset, order_by="id"))
+
+    assert benchmark.pedantic(page, rounds=3) == ROWS
+
+
+@pytest.mark.parametrize("row_type", ["OrderedDict", "dict", "tuple", "record", "raw"])
+def test_row_conversion(benchmark, db, big_table, row_type):
+    row_types = {
+        "OrderedDict": default_row_type,
+        "dict": dict,
+        "tuple": tuple,
+        "record": RECORD,
+        "raw": None,
+    }
+    rows = db.query("SELECT * FROM bench.big").fetchall()
+
+    class Result(object):
+        def keys(self):
+            return ["id", "name", "value"]
+
+        def fetchall(self):
+            return rows
+
+    def convert():
+        return sum(1 for _ in ResultIter(Result(), row_type=row_types[row_type]))
+
+    assert benchmark(convert) == ROWS
+
+
+def test_tables(benchmark, db, big_table):
+    def tables():
+        db.catalog.invalidate()
+        return db.tables
+
+    assert "big" in benchmark(tables)
+
+
+def test_getitem(benchmark, db, big_table):
+    assert benchmark(lambda: db["big"]).name == "big"
+
+
+def test_table_reflection(benchmark, db, big_table):
+    def reflect():
+        db.invalidate_table("bench", "big")
+        return Table(db, "bench", "big")
+
+    assert benchmark(reflect).columns == ["id", "name", "value"]
+
+
+@pytest.fixture(scope="session")
+def points_file(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp("data").join("points.json"))
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"id": i, "name": "point %s" % i},
+            "geometry": {"type": "Point", "coordinates": [1000000 + i, 1000000 + i]},
+        }
+        for i in range(10000)
+    ]
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return path
+
+
+def test_ogr2pg_pg2ogr(benchmark, db, has_postgis, points_file, tmpdir):
+    if not has_postgis or not shutil.which("ogr2ogr"):
+        pytest.skip("requires PostGIS and ogr2ogr")
+    outfile = str(tmpdir.join("points.gpkg"))
+
+    def round_trip():
+        db.ogr2pg(points_file, out_layer="points", schema="bench", s_srs="EPSG:3005")
+        if os.path.exists(outfile):
+            os.remove(outfile)
+        db.pg2ogr("SELECT * FROM bench.points", "GPKG", outfile)
+
+    benchmark.pedantic(round_trip, rounds=3)
+
+
+def test_import_time(benchmark):
+    def import_pgdata():
+        subprocess.run([sys.executable, "-c", "import pgdata"], check=True)
+
+    benchmark.pedantic(import_pgdata, rounds=5)
@@ -1,23 +1,60 @@
 from __future__ import absolute_import
 import os
+import sys
 
 try:
     from urllib.parse import urlparse
 except ImportError:
     from urlparse import urlparse
 
-from pgdata.database import Database
-from pgdata.table import Table
-
 __version__ = "0.0.13dev0"
 
 
-def connect(url=None, schema=None, sql_path=None, multiprocessing=False):
+def __getattr__(name):
+    # Database and Table (and with them sqlalchemy) are imported on first use,
+    # to keep `import pgdata` fast
+    if name == "Database":
+        from pgdata.database import Database
+
+        return Database
+    if name == "Table":
+        from pgdata.table import Table
+
+        return Table
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ (PEP 562) requires python 3.7, import eagerly
+    from pgdata.database import Database  # noqa: F401
+    from pgdata.table import Table  # noqa: F401
+
+
+def connect(url=None, schema=None, sql_path=None, multiprocessing=False, **kwargs):
     """Open a new connection to postgres via psycopg2/sqlalchemy
+
+    Additional keyword arguments (eg ``row_type``) are passed to Database
     """
+    from pgdata.database import Database
+
+    if url is None:
+        url = os.environ.get("DATABASE_URL")
+    return Database(
+        url, schema, sql_path=sql_path, multiprocessing=multiprocessing, **kwargs
+    )
+
+
+def connect_async(url=None, schema=None, **kwargs):
+    """Open a new asyncio connection pool to postgres via psycopg 3
+
+    Requires the psycopg and psycopg_pool packages. Keyword arguments are
+    passed to AsyncDatabase.
+    """
+    from pgdata.aio import AsyncDatabase
+
     if url is None:
         url = os.environ.get("DATABASE_URL")
-    return Database(url, schema, sql_path=sql_path, multiprocessing=multiprocessing)
+    return AsyncDatabase(url, schema, **kwargs)
 
 
 def create_db(url=None):
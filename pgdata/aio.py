@@ -0,0 +1,229 @@
+from __future__ import absolute_import
+import asyncio
+import re
+import uuid
+
+from psycopg import sql as pgsql
+from psycopg_pool import AsyncConnectionPool
+
+from pgdata.catalog import CATALOG_SQL
+from pgdata.util import convert_rows
+from pgdata.util import row_type
+
+
+class AsyncDatabase(object):
+    """
+    Asyncio interface to a PostgreSQL database, mirroring the query methods
+    of Database. Runs on psycopg 3 with a psycopg_pool connection pool of
+    ``min_size`` to ``max_size`` connections, opened on first use.
+    Queries take the same ``%s`` / ``%(name)s`` parameters as Database.
+    ::
+        async with pgdata.connect_async(url) as db:
+            row = await db.query_one("SELECT * FROM t WHERE id = %s", (1,))
+            async for row in db["t"].find(type="spam"):
+                print(row)
+    """
+
+    def __init__(self, url, schema=None, row_type=row_type, min_size=1, max_size=10):
+        self.url = url
+        # libpq does not understand sqlalchemy driver names
+        self.conninfo = re.sub(r"^postgresql\+\w+://", "postgresql://", url)
+        self.schema = schema
+        self.row_type = row_type
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _pool(self):
+        async with self._pool_lock:
+            if self.pool is None:
+                pool = AsyncConnectionPool(
+                    self.conninfo,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    open=False,
+                )
+                await pool.open()
+                self.pool = pool
+        return self.pool
+
+    async def close(self):
+        """Close all connections of the pool
+        """
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self):
+        await self._pool()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _convert(self, cursor, rows):
+        keys = [d.name for d in cursor.description]
+        return convert_rows(self.row_type, keys, rows)
+
+    async def query(self, sql, params=None):
+        """Run a query, returning all rows
+        """
+        pool = await self._pool()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(sql, params)
+            return self._convert(cursor, await cursor.fetchall())
+
+    async def query_one(self, sql, params=None):
+        """Grab just one record
+        """
+        pool = await self._pool()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(sql, params)
+            row = await cursor.fetchone()
+            if row is not None:
+                return self._convert(cursor, [row])[0]
+
+    async def stream(self, sql, params=None, batch_size=5000):
+        """
+        Iterate asynchronously over the results of a query, fetched through
+        a server side cursor ``batch_size`` rows at a time
+        """
+        pool = await self._pool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                name = "pgdata_" + uuid.uuid4().hex
+                async with conn.cursor(name=name) as cursor:
+                    await cursor.execute(sql, params)
+                    while True:
+                        rows = await cursor.fetchmany(batch_size)
+                        for row in self._convert(cursor, rows):
+                            yield row
+                        if len(rows) < batch_size:
+                            break
+
+    async def execute(self, sql, params=None):
+        """Execute a statement in a transaction, returning the row count
+        """
+        pool = await self._pool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                cursor = await conn.execute(sql, params)
+                return cursor.rowcount
+
+    async def execute_many(self, sql, params):
+        """Wrapper for executemany.
+        """
+        pool = await self._pool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(sql, params)
+
+    async def schemas(self):
+        """List all non-system schemas
+        """
+        schemas = []
+        for schema, table, columns, indexes in await self._catalog():
+            if schema not in schemas:
+                schemas.append(schema)
+        return schemas
+
+    async def tables(self):
+        """
+        Get a listing of all tables
+          - if schema specified on connect, return unqualifed table names in
+            that schema
+          - in no schema specified on connect, return all tables, with schema
+            prefixes
+        """
+        rows = [(r[0], r[1]) for r in await self._catalog() if r[1]]
+        if self.schema:
+            return [t for s, t in rows if s == self.schema]
+        return [s + "." + t for s, t in rows]
+
+    async def tables_in_schema(self, schema):
+        """Get a listing of all tables in given schema
+        """
+        return [r[1] for r in await self._catalog() if r[0] == schema and r[1]]
+
+    async def _catalog(self):
+        pool = await self._pool()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(CATALOG_SQL)
+            return await cursor.fetchall()
+
+    def __getitem__(self, table):
+        if "." in table:
+            schema, table = table.split(".")
+        else:
+            schema = self.schema
+        return AsyncTable(self, schema, table)
+
+
+class AsyncTable(object):
+    """Asynchronous counterpart of Table.find / Table.find_one
+    """
+
+    def __init__(self, db, schema, table):
+        self.db = db
+        self.schema = schema
+        self.name = table
+
+    def _select(self, _limit=None, _offset=0, order_by=None, **_filter):
+        if self.schema:
+            table = pgsql.Identifier(self.schema, self.name)
+        else:
+            table = pgsql.Identifier(self.name)
+        query = pgsql.SQL("SELECT * FROM {}").format(table)
+        params = []
+        clauses = []
+        for k, v in _filter.items():
+            if v is None:
+                clauses.append(pgsql.SQL("{} IS NULL").format(pgsql.Identifier(k)))
+                continue
+            elif isinstance(v, (list, tuple)):
+                clauses.append(pgsql.SQL("{} = ANY(%s)").format(pgsql.Identifier(k)))
+                v = list(v)
+            else:
+                clauses.append(pgsql.SQL("{} = %s").format(pgsql.Identifier(k)))
+            params.append(v)
+        if clauses:
+            query = query + pgsql.SQL(" WHERE ") + pgsql.SQL(" AND ").join(clauses)
+        if order_by:
+            if not isinstance(order_by, (list, tuple)):
+                order_by = [order_by]
+            order = [
+                pgsql.SQL("{} DESC").format(pgsql.Identifier(o[1:]))
+                if o.startswith("-")
+                else pgsql.Identifier(o)
+                for o in order_by
+            ]
+            query = query + pgsql.SQL(" ORDER BY ") + pgsql.SQL(", ").join(order)
+        if _limit is not None:
+            query = query + pgsql.SQL(" LIMIT %s")
+            params.append(_limit)
+        if _offset:
+            query = query + pgsql.SQL(" OFFSET %s")
+            params.append(_offset)
+        return query, params
+
+    async def find(self, _limit=None, _offset=0, _step=5000, order_by=None, **_filter):
+        """
+        Iterate asynchronously over the rows matching a simple filter, like
+        Table.find. Rows are streamed through a server side cursor, ``_step``
+        rows at a time.
+        """
+        query, params = self._select(_limit, _offset, order_by, **_filter)
+        async for row in self.db.stream(query, params, batch_size=_step):
+            yield row
+
+    async def find_one(self, **kwargs):
+        """Like find() but returns one result, or None.
+        """
+        kwargs["_limit"] = 1
+        query, params = self._select(**kwargs)
+        return await self.db.query_one(query, params)
+
+    def __repr__(self):
+        return "<AsyncTable(%s)>" % self.name
@@ -0,0 +1,121 @@
+from __future__ import absolute_import
+import threading
+import time
+
+
+# one query for all schemas, tables/views, their columns and indexes,
+# limited to objects visible to the current user (as in information_schema)
+CATALOG_SQL = """
+SELECT
+  n.nspname::text AS schema_name,
+  c.relname::text AS table_name,
+  (SELECT array_agg(a.attname::text ORDER BY a.attnum)
+   FROM pg_catalog.pg_attribute a
+   WHERE a.attrelid = c.oid
+   AND a.attnum > 0
+   AND NOT a.attisdropped) AS columns,
+  (SELECT array_agg(i.relname::text ORDER BY i.relname)
+   FROM pg_catalog.pg_index x
+   INNER JOIN pg_catalog.pg_class i ON x.indexrelid = i.oid
+   WHERE x.indrelid = c.oid) AS indexes
+FROM pg_catalog.pg_namespace n
+LEFT OUTER JOIN pg_catalog.pg_class c
+ON c.relnamespace = n.oid
+AND c.relkind IN ('r', 'p', 'v', 'f')
+AND (pg_has_role(c.relowner, 'USAGE')
+     OR has_table_privilege(
+       c.oid, 'SELECT, INSERT, UPDATE, DELETE, TRUNCATE, REFERENCES, TRIGGER')
+     OR has_any_column_privilege(c.oid, 'SELECT, INSERT, UPDATE, REFERENCES'))
+WHERE left(n.nspname, 3) <> 'pg_'
+AND (pg_has_role(n.nspowner, 'USAGE')
+     OR has_schema_privilege(n.oid, 'CREATE, USAGE'))
+ORDER BY n.nspname, c.relname
+"""
+
+
+class Catalog(object):
+    """
+    Cache of the schemas, tables, columns and indexes of a database, loaded
+    with a single pg_catalog query. The cache is reloaded when it is older
+    than ``ttl`` seconds (never, if ``ttl`` is None), after ``invalidate()``
+    or when ``has_table()`` does not find a table
+    """
+
+    def __init__(self, db, ttl=60):
+        self.db = db
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._schemas = []
+        self._tables = {}
+
+    def refresh(self):
+        """Reload the catalog from the database
+        """
+        with self._lock:
+            schemas = []
+            tables = {}
+            for row in self.db.query(CATALOG_SQL).fetchall():
+                schema, table, columns, indexes = row
+                if schema not in tables:
+                    schemas.append(schema)
+                    tables[schema] = {}
+                if table:
+                    tables[schema][table] = {
+                        "columns": columns or [],
+                        "indexes": indexes or [],
+                    }
+            self._schemas = schemas
+            self._tables = tables
+            self._loaded_at = time.time()
+
+    def invalidate(self):
+        """Mark the catalog as stale, it is reloaded on next access
+        """
+        self._loaded_at = None
+
+    def _current(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or (
+            self.ttl is not None and time.time() - loaded_at >= self.ttl
+        ):
+            self.refresh()
+        return self._tables
+
+    @property
+    def schemas(self):
+        """List all non-system schemas
+        """
+        self._current()
+        return list(self._schemas)
+
+    def tables(self, schema):
+        """List all tables and views in given schema
+        """
+        return list(self._current().get(schema, {}).keys())
+
+    def has_table(self, schema, table):
+        """
+        Check if a table exists, reloading the catalog once if it is not
+        found (it may have been created since the catalog was loaded)
+        """
+        loaded_at = self._loaded_at
+        if table in self._current().get(schema, {}):
+            return True
+        if self._loaded_at == loaded_at:
+            self.refresh()
+        return table in self._tables.get(schema, {})
+
+    def columns(self, schema, table):
+        """List columns of given table, None if the table does not exist
+        """
+        t = self._current().get(schema, {}).get(table)
+        if t:
+            return list(t["columns"])
+
+    def indexes(self, schema, table):
+        """List index names of given table, None if the table does not exist
+        """
+        t = self._current().get(schema, {}).get(table)
+        if t:
+            return list(t["indexes"])
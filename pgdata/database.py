@@ -2,8 +2,19 @@ from __future__ import absolute_import
 from __future__ import print_function
 import os
 import glob
+import gzip
+import logging
+import shutil
 import subprocess
 import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from xml.sax.saxutils import escape
 
 try:
@@ -12,17 +23,130 @@ except ImportError:
     from urlparse import urlparse
 
 from sqlalchemy import create_engine
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import MetaData
+from sqlalchemy.schema import Table as SQLATable
 
+from .catalog import Catalog
+from .instrument import Instrumentation
+from .manifest import Manifest
+from .manifest import options_hash
+from .manifest import source_hash
+from .manifest import source_signature
+from .pool import create_pool_engine
+from .pool import PoolStats
+from .prepared import is_stale_plan_error
+from .prepared import StatementCache
+from .tiles import BC_EXTENT
+from .tiles import Tiles
+from .util import compile_query
+from .util import DatasetException
+from .util import fetch_columns
+from .util import is_ddl
+from .util import is_write
 from .util import row_type
 from .util import QueryDict
 from .table import Table
 import six
 
+log = logging.getLogger(__name__)
+
+# engine of a parallel_execute worker process
+_worker_engine = None
+
+
+def _init_worker(url):
+    global _worker_engine
+    _worker_engine = create_engine(url, pool_size=1)
+
+
+def _execute_partition(engine, sql, partition, after=None):
+    """Execute sql for one partition, returning its row count and run time
+    """
+    start = time.time()
+    # only pass the partition as parameters if the sql uses any
+    params = partition if "%(" in sql else None
+    with engine.begin() as conn:
+        result = conn.execute(sql, params)
+        elapsed = time.time() - start
+        if after:
+            conn.execute(
+                after, dict(partition, rowcount=result.rowcount, elapsed=elapsed)
+            )
+    return {
+        "partition": partition,
+        "rowcount": result.rowcount,
+        "elapsed": elapsed,
+    }
+
+
+def _execute_partition_worker(args):
+    return _execute_partition(_worker_engine, *args)
+
+
+@contextmanager
+def _copy_writer(out_file, compression=None):
+    """
+    Open a path (or wrap a file object) for writing COPY output, compressed
+    with gzip or zstd. Files opened here are closed on exit.
+    """
+    if compression not in (None, "gzip", "zstd"):
+        raise ValueError("Invalid compression: %r" % compression)
+    if isinstance(out_file, six.string_types):
+        fileobj = open(out_file, "wb")
+    else:
+        fileobj = out_file
+    try:
+        if compression == "gzip":
+            with gzip.GzipFile(fileobj=fileobj, mode="wb") as f:
+                yield f
+        elif compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise DatasetException("zstd compression requires zstandard")
+            with zstandard.ZstdCompressor().stream_writer(
+                fileobj, closefd=False
+            ) as f:
+                yield f
+        else:
+            yield fileobj
+    finally:
+        if fileobj is not out_file:
+            fileobj.close()
+
 
 class Database(object):
+    """
+    A connection to a PostgreSQL database.
+
+    ``row_type`` sets the type of rows returned by ``Table.find`` and
+    friends: a dict like type (default OrderedDict), ``tuple``,
+    ``pgdata.util.RECORD`` for compact namedtuple records (with lookup by
+    column name) or None for the SQLAlchemy rows as they are.
+
+    Connections are pooled: up to ``pool_size`` are kept open, with up to
+    ``max_overflow`` more opened when needed (waiting up to ``pool_timeout``
+    seconds for one to be returned beyond that). ``pool_recycle`` sets the
+    maximum age in seconds of a connection, ``pool_pre_ping`` tests
+    connections before use. ``pool_size=0`` disables pooling. With
+    ``multiprocessing=True`` the pool is fork safe: a forked process starts
+    with its own, empty pool. See :py:meth:`pool_stats()`.
+    """
+
     def __init__(
-        self, url, schema=None, row_type=row_type, sql_path=None, multiprocessing=False
+        self,
+        url,
+        schema=None,
+        row_type=row_type,
+        sql_path=None,
+        multiprocessing=False,
+        catalog_ttl=60,
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=-1,
+        pool_pre_ping=False,
     ):
         self.url = url
         u = urlparse(url)
@@ -43,15 +167,35 @@ class Database(object):
             self.ogr_string = self.ogr_string + f" password={password}"
         self.sql_path = sql_path
         self.multiprocessing = multiprocessing
-        # use null pool to ensure the db object can be used by multiprocessing
+        # with multiprocessing, connections are not shared with forked processes
         # http://docs.sqlalchemy.org/en/latest/faq/connections.html#how-do-i-use-engines-connections-sessions-with-python-multiprocessing-or-os-fork
-        if self.multiprocessing:
-            self.engine = create_engine(url, poolclass=NullPool)
-        else:
-            self.engine = create_engine(url)
+        self._pool_stats = PoolStats()
+        self.engine = create_pool_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            fork_safe=multiprocessing,
+            stats=self._pool_stats,
+        )
         self.schema = schema
         self.row_type = row_type
         self.queries = QueryDict(path=self.sql_path)
+        # all tables are reflected into a single MetaData, bound to the engine
+        self.metadata = MetaData(bind=self.engine)
+        self._metadata_lock = threading.RLock()
+        # schemas/tables/columns/indexes, cached for catalog_ttl seconds
+        self.catalog = Catalog(self, ttl=catalog_ttl)
+        self._geometry_oids = None
+        self.instrumentation = None
+        self.statement_cache = None
+        # exact Table.count results, see invalidate_counts
+        self._counts = OrderedDict()
+        self._counts_lock = threading.Lock()
+        # sources loaded by ogr2pg(incremental=True)
+        self.manifest = Manifest(self)
 
     @property
     def schemas(self):
@@ -59,10 +203,7 @@ class Database(object):
         Get a listing of all non-system schemas (prefixed with 'pg_') that
         exist in the database.
         """
-        sql = """SELECT schema_name FROM information_schema.schemata
-                 ORDER BY schema_name"""
-        schemas = self.query(sql).fetchall()
-        return [s[0] for s in schemas if s[0][:3] != "pg_"]
+        return self.catalog.schemas
 
     @property
     def tables(self):
@@ -88,8 +229,9 @@ class Database(object):
             print(notice)
 
     def __getitem__(self, table):
-        if table in self.tables:
-            return self.load_table(table)
+        loaded = self.load_table(table)
+        if loaded is not None:
+            return loaded
         # if table doesn't exist, return empty table object
         else:
             return Table(self, "public", None)
@@ -113,18 +255,20 @@ class Database(object):
         lookup = {'myInputField':'customer_id', 'myInputTable':'customers'}
         sql = db.build_query(sql, lookup)
 
+        Templates are parsed once and cached, so rendering the same sql
+        repeatedly is cheap. Values (as opposed to identifiers) are better
+        passed as parameters to execute/query.
         """
-        for key, val in six.iteritems(lookup):
-            sql = sql.replace("$" + key, val)
-        return sql
+        rendered = compile_query(sql).render(lookup)
+        name = self.queries.name_of(sql)
+        if name:
+            self.queries.register(rendered, name)
+        return rendered
 
     def tables_in_schema(self, schema):
         """Get a listing of all tables in given schema
         """
-        sql = """SELECT table_name
-                 FROM information_schema.tables
-                 WHERE table_schema = %s"""
-        return [t[0] for t in self.query(sql, (schema,)).fetchall()]
+        return self.catalog.tables(schema)
 
     def parse_table_name(self, table):
         """Parse schema qualified table name
@@ -142,45 +286,305 @@ class Database(object):
         schema, table = self.parse_table_name(table)
         if not schema:
             schema = self.schema
-            tables = self.tables
-        else:
-            tables = self.tables_in_schema(schema)
-        if table in tables:
+        if self.catalog.has_table(schema, table):
             return Table(self, schema, table)
         else:
             return None
 
+    def _table_key(self, schema, table):
+        if schema:
+            return schema + "." + table
+        return table
+
+    def reflect_table(self, schema, table, refresh=False):
+        """
+        Return the SQLAlchemy table for given schema and table, reflecting it
+        into the shared MetaData only if it has not been reflected already
+        (or if ``refresh`` is set).
+        """
+        # load custom types to stop sqlalchemy from complaining
+        import geoalchemy2  # noqa: F401
+        import sqlalchemy_utils  # noqa: F401
+
+        with self._metadata_lock:
+            if refresh:
+                self.invalidate_table(schema, table)
+            key = self._table_key(schema, table)
+            if key in self.metadata.tables:
+                cached = self.metadata.tables[key]
+                # reflect again if the table was altered outside of pgdata
+                columns = self.catalog.columns(schema, table)
+                if not columns or [c.name for c in cached.columns] == columns:
+                    return cached
+                self.metadata.remove(cached)
+            return SQLATable(table, self.metadata, schema=schema, autoload=True)
+
+    def invalidate_table(self, schema, table):
+        """
+        Remove a table from the shared MetaData (and mark the catalog as
+        stale) so that it is reflected again on next use. Call this after
+        altering a table outside of pgdata.
+        """
+        self.catalog.invalidate()
+        self.invalidate_counts(schema, table)
+        with self._metadata_lock:
+            key = self._table_key(schema, table)
+            if key in self.metadata.tables:
+                self.metadata.remove(self.metadata.tables[key])
+
+    def invalidate_tables(self):
+        """
+        Mark the catalog as stale and remove all tables from the shared
+        MetaData, so that they are reflected again on next use - done after
+        DDL statements run with execute.
+        """
+        self.catalog.invalidate()
+        self.invalidate_counts()
+        with self._metadata_lock:
+            self.metadata.clear()
+
+    def invalidate_counts(self, schema=None, table=None):
+        """
+        Forget the cached exact row counts of a table (of all tables if no
+        table is given). Writes made through pgdata do this automatically.
+        """
+        with self._counts_lock:
+            if table is None:
+                self._counts.clear()
+            else:
+                for key in [k for k in self._counts if k[:2] == (schema, table)]:
+                    del self._counts[key]
+
+    def _invalidate_after(self, sql):
+        """Forget the cached tables and counts a statement may have changed
+        """
+        if is_ddl(sql):
+            self.invalidate_tables()
+        elif is_write(sql):
+            self.invalidate_counts()
+
+    def instrument(self, slow_threshold=None, explain=False, window=1000):
+        """
+        Start recording timings of all statements run by this database, see
+        :py:class:`pgdata.instrument.Instrumentation`. Returns the
+        Instrumentation object, also available as ``self.instrumentation``.
+        ::
+            profile = db.instrument(slow_threshold=5, explain=True)
+            db.execute(db.queries["overlay"])
+            profile.stats()["overlay"]["p95"]
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.remove()
+        self.instrumentation = Instrumentation(
+            self, slow_threshold=slow_threshold, explain=explain, window=window
+        )
+        return self.instrumentation
+
+    def prepare_statements(self, size=100):
+        """
+        Run repeated parameterized statements as server side prepared
+        statements, keeping at most ``size`` per connection, see
+        :py:class:`pgdata.prepared.StatementCache`. Returns the
+        StatementCache, also available as ``self.statement_cache``.
+        ::
+            cache = db.prepare_statements()
+            for id in ids:
+                db.query_one("SELECT * FROM streams WHERE id = %s", (id,))
+            cache.stats()["hit_rate"]
+        """
+        if self.statement_cache is not None:
+            self.statement_cache.remove()
+        self.statement_cache = StatementCache(self, size=size)
+        return self.statement_cache
+
+    def _retry_stale_plan(self, fn, *args):
+        """
+        Call ``fn(*args)``, once more if it failed on a prepared statement
+        invalidated by a DDL change (the StatementCache then deallocated it)
+        """
+        try:
+            return fn(*args)
+        except Exception as e:
+            if self.statement_cache is None or not is_stale_plan_error(e):
+                raise
+            return fn(*args)
+
+    def pool_stats(self):
+        """
+        Return statistics of the connection pool of this process: the number
+        of connections ``checked_out``, ``checked_in`` (idle) and in
+        ``overflow``, and counts of ``checkouts``, ``checkins``, ``connects``
+        (connections opened), ``invalidations``, ``waits`` (checkouts that
+        waited for a connection to be returned) and the total ``wait_time``.
+        """
+        pool = self.engine.pool
+        stats = {"pid": os.getpid(), "pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        stats.update(self._pool_stats.counts)
+        return stats
+
     def mogrify(self, sql, params):
         """Return the query string with parameters added
         """
         conn = self.engine.raw_connection()
-        cursor = conn.cursor()
-        return cursor.mogrify(sql, params)
+        try:
+            cursor = conn.cursor()
+            return cursor.mogrify(sql, params)
+        finally:
+            conn.close()
 
     def execute(self, sql, params=None):
         """Just a pointer to engine.execute
         """
+        result = self._retry_stale_plan(self._execute, sql, params)
+        self._invalidate_after(sql)
+        return result
+
+    def _execute(self, sql, params):
         # wrap in a transaction to ensure things are committed
         # https://github.com/smnorris/pgdata/issues/3
         with self.engine.begin() as conn:
-            result = conn.execute(sql, params)
-        return result
+            return conn.execute(sql, params)
 
     def execute_many(self, sql, params):
         """Wrapper for executemany.
         """
-        self.engine.executemany(sql, params)
+        with self.engine.begin() as conn:
+            conn.execute(sql, params)
+        self._invalidate_after(sql)
 
-    def query(self, sql, params=None):
+    def query(self, sql, params=None, stream=False, batch_size=None):
         """Another word for execute
+
+        With ``stream=True`` the results are fetched through a server side
+        cursor, buffering at most ``batch_size`` rows on the client.
+        """
+        if stream:
+            return self.stream_engine(batch_size).execute(sql, params)
+        result = self._retry_stale_plan(self.engine.execute, sql, params)
+        self._invalidate_after(sql)
+        return result
+
+    def stream_engine(self, batch_size=None):
+        """Return the engine set to stream results with server side cursors
+        """
+        if batch_size:
+            return self.engine.execution_options(
+                stream_results=True, max_row_buffer=batch_size
+            )
+        return self.engine.execution_options(stream_results=True)
+
+    @property
+    def geometry_oids(self):
+        """Type oids of the PostGIS geometry and geography types, if installed
+        """
+        if self._geometry_oids is None:
+            sql = """SELECT oid FROM pg_type
+                     WHERE typname IN ('geometry', 'geography')"""
+            self._geometry_oids = tuple(r[0] for r in self.query(sql).fetchall())
+        return self._geometry_oids
+
+    def query_columns(self, sql, params=None, backend="numpy", batch_size=10000):
         """
-        return self.engine.execute(sql, params)
+        Run a query and return the results as columns rather than rows:
+        a dict of numpy arrays (``backend="numpy"``) or a pyarrow Table
+        (``backend="arrow"``). Rows are fetched through a server side cursor
+        ``batch_size`` at a time, geometries are returned as WKB bytes.
+        ``sql`` may also be a SQLAlchemy selectable.
+        ::
+            columns = db.query_columns("SELECT id, length FROM streams")
+            columns["length"].sum()
+        """
+        if not isinstance(sql, six.string_types):
+            compiled = sql.compile(dialect=self.engine.dialect)
+            sql, params = six.text_type(compiled), compiled.params
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor(name="pgdata_columns_" + uuid.uuid4().hex)
+            cursor.itersize = batch_size
+            cursor.execute(sql, params)
+            result = fetch_columns(
+                cursor,
+                batch_size=batch_size,
+                backend=backend,
+                binary_oids=self.geometry_oids,
+            )
+            cursor.close()
+            conn.commit()
+        finally:
+            conn.close()
+        return result
+
+    def copy_out(
+        self,
+        sql,
+        out_file,
+        params=None,
+        format="csv",
+        header=True,
+        compression=None,
+    ):
+        """
+        Export the results of a query with COPY TO STDOUT, streamed as it is
+        received into ``out_file``, a path or a file object open for writing
+        bytes. ``format`` is one of ``csv``, ``text`` or ``binary``, ``header``
+        applies to csv only. Output is compressed with ``compression="gzip"``
+        or ``"zstd"`` (requires the zstandard package), which is inferred from
+        a ``.gz`` / ``.zst`` path extension when not given.
+        ``sql`` may also be a table name or a SQLAlchemy selectable.
+        ::
+            db.copy_out("SELECT * FROM streams", "streams.csv.gz")
+        Returns the number of rows exported.
+        """
+        if format not in ("csv", "text", "binary"):
+            raise ValueError("Invalid COPY format: %r" % format)
+        if not isinstance(sql, six.string_types):
+            compiled = sql.compile(dialect=self.engine.dialect)
+            sql, params = six.text_type(compiled), compiled.params
+        if compression is None and isinstance(out_file, six.string_types):
+            if out_file.endswith(".gz"):
+                compression = "gzip"
+            elif out_file.endswith(".zst"):
+                compression = "zstd"
+
+        options = ["FORMAT " + format]
+        if format == "csv" and header:
+            options.append("HEADER")
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            if params:
+                sql = cursor.mogrify(sql, params).decode(conn.encoding)
+            # a single word is a table name, anything else a query
+            query = len(sql.split()) > 1
+            copy_sql = "COPY {q} TO STDOUT WITH ({o})".format(
+                q="(" + sql + ")" if query else sql, o=", ".join(options)
+            )
+            with _copy_writer(out_file, compression) as f:
+                cursor.copy_expert(copy_sql, f)
+            conn.commit()
+        finally:
+            conn.close()
+        # the query may be an INSERT, UPDATE or DELETE ... RETURNING
+        if query:
+            self._invalidate_after(sql)
+        return cursor.rowcount
 
     def query_one(self, sql, params=None):
         """Grab just one record
         """
-        r = self.engine.execute(sql, params)
-        return r.fetchone()
+        r = self._retry_stale_plan(self.engine.execute, sql, params)
+        row = r.fetchone()
+        # release the connection now rather than when the result is collected
+        r.close()
+        self._invalidate_after(sql)
+        return row
 
     def create_schema(self, schema):
         """Create specified schema if it does not already exist
@@ -216,6 +620,261 @@ class Database(object):
         else:
             return Table(self, schema, table, columns)
 
+    def create_indexes(self, specs, workers=4, analyze=True, **kwargs):
+        """
+        Build many indexes at once, each on its own connection, with up to
+        ``workers`` builds running at a time, then ANALYZE the indexed
+        tables. ``specs`` is a list of dicts with a ``table`` and
+        :py:meth:`Table.create_index() <pgdata.Table.create_index>` keyword
+        arguments; other keyword arguments (eg ``concurrently``,
+        ``maintenance_work_mem``) apply to all specs. A failed build does
+        not stop the others. Builds on a table with any concurrent build
+        run one at a time, in the order given (a concurrent build waits for
+        all other builds on its table, so mixing them would deadlock).
+
+        Returns a list (in the order of ``specs``) of dicts with keys
+        ``spec``, ``error`` (None if the index was built) and ``elapsed``.
+        ::
+            results = db.create_indexes([
+                {"table": "whse.streams", "columns": ["blue_line_key"]},
+                {"table": "whse.streams", "columns": ["geom"], "index_type": "gist"},
+            ], workers=8, maintenance_work_mem="1GB")
+        """
+        tables = {}
+        options = []
+        for i, spec in enumerate(specs):
+            o = dict(kwargs)
+            o.update((k, v) for k, v in spec.items() if k != "table")
+            options.append(o)
+            try:
+                schema, table = self.parse_table_name(spec["table"])
+                key = (schema or self.schema, table)
+            except ValueError:
+                # reported as the error of this index by _create
+                key = (None, spec["table"])
+            tables.setdefault(key, []).append(i)
+        jobs = []
+        for table, indexes in tables.items():
+            if any(options[i].get("concurrently") for i in indexes):
+                jobs.append((table, indexes))
+            else:
+                jobs.extend((table, [i]) for i in indexes)
+
+        results = [None] * len(specs)
+        analyze_tables = OrderedDict()
+
+        def _create(job):
+            (schema, name), indexes = job
+            name = schema + "." + name if schema else name
+            for i in indexes:
+                start = time.time()
+                try:
+                    # in the try, so that a bad table name is reported per index
+                    table = self[name]
+                    table.create_index(**options[i])
+                    error = None
+                    analyze_tables[table._regclass()] = True
+                except Exception as e:
+                    log.error("could not create index %s: %s", specs[i], e)
+                    error = str(e)
+                results[i] = {
+                    "spec": specs[i],
+                    "error": error,
+                    "elapsed": time.time() - start,
+                }
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_create, jobs))
+            if analyze:
+                list(
+                    executor.map(
+                        lambda t: self.execute("ANALYZE " + t), list(analyze_tables)
+                    )
+                )
+        return results
+
+    def partitions(self, table, column, parts=None):
+        """
+        Split ``table`` on ``column`` into partitions for parallel_execute.
+
+        With ``parts``, return up to that many ranges holding similar numbers
+        of rows, as dicts with keys ``lo`` (inclusive), ``hi`` (exclusive,
+        None for the last range) and ``where``, the matching sql condition -
+        rows with a null ``column`` are in the first range.
+        Otherwise return one partition per distinct value (null included), as
+        dicts with keys ``value`` and ``where``.
+        """
+        if parts:
+            return self._range_partitions(table, column, parts)
+        sql = "SELECT DISTINCT {c} FROM {t} ORDER BY {c} NULLS FIRST".format(
+            c=column, t=table
+        )
+        return [
+            {
+                "value": r[0],
+                "where": "{c} IS NULL".format(c=column)
+                if r[0] is None
+                else "{c} = {v}".format(c=column, v=self._literal(r[0])),
+            }
+            for r in self.query(sql).fetchall()
+        ]
+
+    def _range_partitions(self, relation, column, parts):
+        """
+        Split the rows of ``relation`` (a table name or an aliased subquery)
+        into up to ``parts`` ranges of ``column`` holding similar numbers of
+        rows, as dicts with keys ``lo`` (the lowest value of the range),
+        ``hi`` (exclusive, None for the last range) and ``where``. Rows with
+        a null ``column`` go in the first range.
+        """
+        fractions = [i / float(parts) for i in range(parts)]
+        sql = """SELECT percentile_disc(%(fractions)s) WITHIN GROUP (ORDER BY {c})
+                 FROM {r}""".format(
+            c=column, r=relation.replace("%", "%%")
+        )
+        bounds = self.query_one(sql, {"fractions": fractions})[0]
+        bounds = sorted(set(b for b in bounds or [] if b is not None))
+        if not bounds:
+            return [{"lo": None, "hi": None, "where": "TRUE"}]
+        partitions = []
+        for lo, hi in zip(bounds, bounds[1:] + [None]):
+            if lo == bounds[0]:
+                # the first range has no lower bound and takes the nulls
+                where = "TRUE" if hi is None else "({c} < {hi} OR {c} IS NULL)"
+            elif hi is None:
+                where = "{c} >= {lo}"
+            else:
+                where = "{c} >= {lo} AND {c} < {hi}"
+            where = where.format(
+                c=column,
+                lo=self._literal(lo),
+                hi=None if hi is None else self._literal(hi),
+            )
+            partitions.append({"lo": lo, "hi": hi, "where": where})
+        return partitions
+
+    def _literal(self, value):
+        """Return value as a sql literal
+        """
+        return self.mogrify("%s", (value,)).decode("utf-8")
+
+    def parallel_execute(
+        self,
+        sql,
+        partitions,
+        workers=4,
+        lookup=None,
+        processes=False,
+        progress=None,
+        after=None,
+    ):
+        """
+        Execute a sql statement once per partition, in parallel.
+
+        ``sql`` is the name of a query in ``self.queries`` or a sql string.
+        Each partition is a dict (see :py:meth:`partitions()`) substituted
+        into the sql with build_query (``$where``, ``$value``, ...) together
+        with ``lookup``, and passed as parameters if the sql contains any
+        ``%(name)s`` placeholders.
+
+        Statements run on ``workers`` threads (or processes, if ``processes``
+        is set), each with its own connection, so at most ``workers``
+        connections are used. After each partition is done, progress is
+        logged and ``progress(result, done, total)`` is called if provided.
+        If a partition fails (or progress raises an exception), partitions
+        not yet started are cancelled.
+        ``after`` is an optional statement run in the same transaction as
+        each partition, with the partition, ``rowcount`` and ``elapsed`` as
+        parameters (eg to record that the partition is done).
+
+        Returns a list (in the order of ``partitions``) of dicts with keys
+        ``partition``, ``rowcount`` and ``elapsed`` (seconds).
+        ::
+            parts = db.partitions("whse.streams", "watershed_group_code")
+            db.parallel_execute("overlay", parts, workers=8)
+        """
+        if sql in self.queries:
+            sql = self.queries[sql]
+        lookup = lookup or {}
+        jobs = [
+            (self.build_query(sql, dict(lookup, **partition)), partition, after)
+            for partition in partitions
+        ]
+        total = len(jobs)
+        results = [None] * total
+        done = 0
+        if processes:
+            executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(self.url,)
+            )
+            engine = None
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            engine = create_engine(self.url, pool_size=workers, max_overflow=0)
+        try:
+            with executor:
+                if processes:
+                    futures = [
+                        executor.submit(_execute_partition_worker, job) for job in jobs
+                    ]
+                else:
+                    futures = [
+                        executor.submit(_execute_partition, engine, *job)
+                        for job in jobs
+                    ]
+                index = dict((f, i) for i, f in enumerate(futures))
+                try:
+                    for future in as_completed(futures):
+                        result = future.result()
+                        results[index[future]] = result
+                        done += 1
+                        log.info(
+                            "partition %s done (%s of %s) in %.1fs",
+                            result["partition"],
+                            done,
+                            total,
+                            result["elapsed"],
+                        )
+                        if progress:
+                            progress(result, done, total)
+                except BaseException:
+                    # on error or interrupt, do not start the pending partitions
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            if engine is not None:
+                engine.dispose()
+        self._invalidate_after(sql)
+        return results
+
+    def tiles(
+        self,
+        table=None,
+        extent=BC_EXTENT,
+        srid=3005,
+        size=100000,
+        id_column="tile_id",
+        geom_column=None,
+    ):
+        """
+        Return the tile grid stored in ``table`` (created if it does not
+        exist, by default 100km tiles over BC in BC Albers, in a table named
+        after the grid), for running queries tile by tile, see
+        :py:class:`pgdata.tiles.Tiles`.
+        ::
+            db.tiles(size=50000).run("overlay", target="temp.overlay", workers=8)
+        """
+        return Tiles(
+            self,
+            table,
+            extent=extent,
+            srid=srid,
+            size=size,
+            id_column=id_column,
+            geom_column=geom_column,
+        )
+
     def ogr2pg(
         self,
         in_file,
@@ -233,6 +892,7 @@ class Database(object):
         geom=True,
         cmd_only=False,
         cmd_as_list=False,
+        incremental=False,
     ):
         """
         Load a layer to provided pgdata database connection using OGR2OGR
@@ -240,12 +900,41 @@ class Database(object):
         -sql option is like an ESRI where_clause or the ogr2ogr -where option,
         but to increase flexibility, it is in SQLITE dialect:
         SELECT * FROM <in_layer> WHERE <sql>
+
+        With ``incremental=True``, sources that have not changed since their
+        last successful load with the same options (as recorded in
+        ``self.manifest``) are skipped.
+        If ``fid`` is given and the table exists, a changed source is loaded
+        into a staging table and only the differences (by ``fid``) are
+        applied to the table. Loading a source replaces the whole table, so
+        other sources loaded to the same table are loaded again by their
+        next incremental load. Incremental loads cannot ``append``: the fids
+        of several sources are not unique in their table, and the rows of
+        one source could not be told from the others.
+        Returns a dict with the ``status`` of the load (``skipped``,
+        ``loaded`` or ``merged``), the ``rowcount`` of the table and, when
+        merged, the numbers of rows ``inserted``, ``updated`` and ``deleted``.
         """
-        # if not provided a layer name, use the name of the input file
-        if not in_layer:
-            in_layer = os.path.splitext(os.path.basename(in_file))[0]
-        if not out_layer:
-            out_layer = in_layer.lower()
+        in_layer, out_layer = self._ogr2pg_layers(in_file, in_layer, out_layer)
+        if incremental and not cmd_only:
+            return self._ogr2pg_incremental(
+                in_file,
+                in_layer,
+                out_layer,
+                schema,
+                fid,
+                dict(
+                    s_srs=s_srs,
+                    t_srs=t_srs,
+                    sql=sql,
+                    fid=fid,
+                    fid64=fid64,
+                    dim=dim,
+                    index=index,
+                    append=append,
+                    geom=geom,
+                ),
+            )
         command = [
             "ogr2ogr",
             "-f",
@@ -302,6 +991,268 @@ class Database(object):
             return command
         else:
             subprocess.run(command)
+            self.invalidate_table(schema, out_layer)
+
+    def _ogr2pg_incremental(self, in_file, in_layer, out_layer, schema, fid, options):
+        """Load a source with ogr2pg unless it is unchanged, see ogr2pg
+        """
+        if options["append"]:
+            raise ValueError(
+                "Incremental loads cannot append, the rows of a changed source "
+                "could not be told from the rows of other sources"
+            )
+        source = os.path.abspath(in_file) if os.path.exists(in_file) else in_file
+        target = schema + "." + out_layer
+        signature = source_signature(in_file)
+        # the index option does not change the data loaded
+        options_key = options_hash(
+            dict((k, v) for k, v in options.items() if k != "index")
+        )
+        entry = self.manifest.get(source, in_layer, target)
+        # not from the catalog, which may not have seen a recent drop
+        preparer = self.engine.dialect.identifier_preparer
+        exists = (
+            self.query_one(
+                "SELECT to_regclass(%s)",
+                (preparer.quote(schema) + "." + preparer.quote(out_layer),),
+            )[0]
+            is not None
+        )
+        unchanged, sha256 = self.manifest.unchanged(
+            entry, in_file, signature, options_key
+        )
+        if unchanged and exists:
+            if entry["mtime"] != signature["mtime"]:
+                # touched but not modified, remember the new mtime
+                self.manifest.record(
+                    source,
+                    in_layer,
+                    target,
+                    signature,
+                    sha256,
+                    entry["rowcount"],
+                    options_key,
+                )
+            log.info("ogr2pg: %s unchanged since %s", in_file, entry["loaded_at"])
+            return {"status": "skipped", "rowcount": entry["rowcount"]}
+        if signature is not None and sha256 is None:
+            sha256 = source_hash(in_file)
+
+        result = {"status": "loaded"}
+        if fid and exists:
+            stage = out_layer + "_pgdata_stage"
+            command = self.ogr2pg(
+                in_file,
+                in_layer=in_layer,
+                out_layer=stage,
+                schema=schema,
+                cmd_only=True,
+                cmd_as_list=True,
+                **dict(options, index=False)
+            )
+            self._check_ogr2pg(in_file, self._run_command(command))
+            try:
+                result = self._merge_stage(schema, stage, out_layer, fid)
+            finally:
+                self.execute("DROP TABLE IF EXISTS {s}.{t}".format(s=schema, t=stage))
+        else:
+            command = self.ogr2pg(
+                in_file,
+                in_layer=in_layer,
+                out_layer=out_layer,
+                schema=schema,
+                cmd_only=True,
+                cmd_as_list=True,
+                **options
+            )
+            self._check_ogr2pg(in_file, self._run_command(command))
+        # the rows of other sources loaded to the target are gone, they are
+        # loaded again by their next incremental job
+        self.manifest.forget(target, source, in_layer)
+        self.invalidate_table(schema, out_layer)
+        result["rowcount"] = self.query_one(
+            "SELECT count(*) FROM {s}.{t}".format(s=schema, t=out_layer)
+        )[0]
+        self.manifest.record(
+            source,
+            in_layer,
+            target,
+            signature,
+            sha256,
+            result["rowcount"],
+            options_key,
+        )
+        return result
+
+    def _check_ogr2pg(self, in_file, result):
+        if result["returncode"] != 0:
+            raise DatasetException(
+                "ogr2pg failed for %s: %s" % (in_file, result["stderr"])
+            )
+
+    def _merge_stage(self, schema, stage, table, key):
+        """
+        Apply the differences between a staging table and a table, matching
+        rows on ``key``: delete rows missing from the stage, update changed
+        rows and insert new rows, in a single transaction
+        """
+        self.catalog.invalidate()
+        stage_columns = self.catalog.columns(schema, stage)
+        columns = [c for c in self.catalog.columns(schema, table) if c in stage_columns]
+        if key not in columns:
+            raise ValueError(
+                "Key %s is not a column of both %s and %s" % (key, table, stage)
+            )
+        preparer = self.engine.dialect.identifier_preparer
+        q = preparer.quote
+        values = dict(
+            t=q(schema) + "." + q(table),
+            s=q(schema) + "." + q(stage),
+            k=q(key),
+            c=", ".join(q(c) for c in columns),
+            tc=", ".join("t." + q(c) for c in columns),
+            sc=", ".join("s." + q(c) for c in columns),
+            set=", ".join(
+                "{c} = s.{c}".format(c=q(c)) for c in columns if c != key
+            ),
+        )
+        with self.engine.begin() as conn:
+            deleted = conn.execute(
+                """DELETE FROM {t} t
+                   WHERE NOT EXISTS (SELECT 1 FROM {s} s WHERE s.{k} = t.{k})
+                """.format(**values)
+            ).rowcount
+            updated = 0
+            if values["set"]:
+                updated = conn.execute(
+                    """UPDATE {t} t SET {set}
+                       FROM {s} s
+                       WHERE t.{k} = s.{k}
+                       AND ({tc}) IS DISTINCT FROM ({sc})
+                    """.format(**values)
+                ).rowcount
+            inserted = conn.execute(
+                """INSERT INTO {t} ({c})
+                   SELECT {c} FROM {s} s
+                   WHERE NOT EXISTS (SELECT 1 FROM {t} t WHERE t.{k} = s.{k})
+                """.format(**values)
+            ).rowcount
+        self.invalidate_counts(schema, table)
+        log.info(
+            "merged %s into %s: %s inserted, %s updated, %s deleted",
+            stage,
+            table,
+            inserted,
+            updated,
+            deleted,
+        )
+        return {
+            "status": "merged",
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted,
+        }
+
+    def _ogr2pg_layers(self, in_file, in_layer=None, out_layer=None):
+        """Return input and output layer names for ogr2pg
+        """
+        # if not provided a layer name, use the name of the input file
+        if not in_layer:
+            in_layer = os.path.splitext(os.path.basename(in_file))[0]
+        if not out_layer:
+            out_layer = in_layer.lower()
+        return in_layer, out_layer
+
+    def _run_command(self, command):
+        """
+        Run a command, returning a dict with the command, its exit code
+        (None if it could not be started), stderr and run time in seconds
+        """
+        start = time.time()
+        try:
+            result = subprocess.run(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            returncode = result.returncode
+            stderr = result.stderr.decode("utf-8", "replace")
+        except OSError as e:
+            returncode = None
+            stderr = str(e)
+        return {
+            "command": command,
+            "returncode": returncode,
+            "stderr": stderr,
+            "elapsed": time.time() - start,
+        }
+
+    def ogr2pg_many(self, jobs, workers=4):
+        """
+        Run many ogr2pg loads in parallel.
+
+        ``jobs`` is a list of dicts of :py:meth:`ogr2pg()` keyword arguments.
+        Up to ``workers`` ogr2ogr processes run at once; jobs writing to the
+        same table run one at a time, in the order given. A failed job does
+        not stop the others.
+
+        Returns a list (in the order of ``jobs``) of dicts with keys
+        ``job``, ``command``, ``returncode``, ``stderr`` and ``elapsed``
+        (and ``status``, for incremental jobs).
+        ::
+            results = db.ogr2pg_many([
+                {"in_file": "a.shp", "schema": "whse"},
+                {"in_file": "b.gpkg", "in_layer": "roads", "schema": "whse"},
+            ], workers=4)
+            failed = [r for r in results if r["returncode"] != 0]
+        """
+        # group the commands by target table
+        targets = OrderedDict()
+        for i, job in enumerate(jobs):
+            command = self.ogr2pg(**dict(job, cmd_only=True, cmd_as_list=True))
+            schema = job.get("schema", "public")
+            out_layer = self._ogr2pg_layers(
+                job["in_file"], job.get("in_layer"), job.get("out_layer")
+            )[1]
+            targets.setdefault((schema, out_layer), []).append((i, command))
+
+        results = [None] * len(jobs)
+        if any(job.get("incremental") for job in jobs):
+            # once, rather than concurrently from each job
+            self.manifest.create()
+
+        def _load(target_jobs):
+            for i, command in target_jobs:
+                if jobs[i].get("incremental"):
+                    result = self._ogr2pg_job(jobs[i], command)
+                else:
+                    result = self._run_command(command)
+                result["job"] = jobs[i]
+                if result["returncode"] != 0:
+                    log.error("ogr2pg failed for %s: %s", jobs[i], result["stderr"])
+                results[i] = result
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_load, targets.values()))
+
+        for schema, out_layer in targets:
+            self.invalidate_table(schema, out_layer)
+        return results
+
+    def _ogr2pg_job(self, job, command):
+        """Run an incremental ogr2pg job, reporting like _run_command
+        """
+        start = time.time()
+        try:
+            status = self.ogr2pg(**job)
+            returncode, stderr = 0, ""
+        except Exception as e:
+            status, returncode, stderr = None, 1, str(e)
+        return {
+            "command": command,
+            "returncode": returncode,
+            "stderr": stderr,
+            "elapsed": time.time() - start,
+            "status": status,
+        }
 
     def pg2ogr(
         self,
@@ -314,6 +1265,8 @@ class Database(object):
         t_srs=None,
         geom_type=None,
         append=False,
+        split_key=None,
+        workers=1,
     ):
         """
         A wrapper around ogr2ogr, for quickly dumping a postgis query to file.
@@ -322,9 +1275,56 @@ class Database(object):
            - for Shapefile, consider supplying a column_remap dict
            - for FileGDB, geom_type is required
              (https://trac.osgeo.org/gdal/ticket/4186)
+
+        For GPKG and FileGDB outputs, provide ``split_key`` (a column of the
+        query) and ``workers`` to export in parallel: the query is split into
+        ``workers`` ranges of ``split_key``, each range is dumped to a part
+        file by its own ogr2ogr process, then the parts are appended to
+        ``outfile`` in key order.
         """
         if driver == "FileGDB" and geom_type is None:
             raise ValueError("Specify geom_type when writing to FileGDB")
+        if split_key and workers > 1:
+            return self._pg2ogr_parallel(
+                sql,
+                driver,
+                outfile,
+                outlayer=outlayer,
+                column_remap=column_remap,
+                s_srs=s_srs,
+                t_srs=t_srs,
+                geom_type=geom_type,
+                append=append,
+                split_key=split_key,
+                workers=workers,
+            )
+        command = self._pg2ogr_command(
+            sql,
+            driver,
+            outfile,
+            outlayer=outlayer,
+            column_remap=column_remap,
+            s_srs=s_srs,
+            t_srs=t_srs,
+            geom_type=geom_type,
+            append=append,
+        )
+        subprocess.run(command)
+
+    def _pg2ogr_command(
+        self,
+        sql,
+        driver,
+        outfile,
+        outlayer=None,
+        column_remap=None,
+        s_srs="EPSG:3005",
+        t_srs=None,
+        geom_type=None,
+        append=False,
+    ):
+        """Write the VRT for a pg2ogr dump and return the ogr2ogr command
+        """
         filename, ext = os.path.splitext(os.path.basename(outfile))
         if not outlayer:
             outlayer = filename
@@ -336,8 +1336,10 @@ class Database(object):
         if column_remap:
             # if specifiying output field names, all fields have to be specified
             # rather than try and parse the input sql, just do a test run of the
-            # query and grab column names from that
-            columns = [c for c in self.query(sql).keys() if c != "geom"]
+            # query (returning no rows) and grab column names from that
+            column_remap = dict(column_remap)
+            test_sql = "SELECT * FROM ({}) AS q LIMIT 0".format(sql)
+            columns = [c for c in self.query(test_sql).keys() if c != "geom"]
             # make sure all columns are represented in the remap
             for c in columns:
                 if c not in column_remap.keys():
@@ -372,7 +1374,7 @@ class Database(object):
         if driver == "GeoJSON" and not t_srs:
             t_srs = "EPSG:4326"
         # otherwise, default to BC Albers
-        else:
+        elif not t_srs:
             t_srs = "EPSG:3005"
         command = [
             "ogr2ogr",
@@ -396,4 +1398,86 @@ class Database(object):
         # if specified, append to existing output
         if append:
             command.insert(len(command), "-append")
-        subprocess.run(command)
+        return command
+
+    def _pg2ogr_parallel(
+        self,
+        sql,
+        driver,
+        outfile,
+        outlayer=None,
+        column_remap=None,
+        s_srs="EPSG:3005",
+        t_srs=None,
+        geom_type=None,
+        append=False,
+        split_key=None,
+        workers=2,
+    ):
+        """Dump ranges of a query to part files in parallel, then merge them
+        """
+        if driver not in ("FileGDB", "GPKG"):
+            raise ValueError("Parallel pg2ogr supports only GPKG and FileGDB outputs")
+        if not outlayer:
+            outlayer = os.path.splitext(os.path.basename(outfile))[0]
+        tempdir = tempfile.mkdtemp(prefix="pg2ogr_")
+        commands = []
+        try:
+            ranges = self._range_partitions(
+                "({sql}) AS q".format(sql=sql), split_key, workers
+            )
+            for i, part in enumerate(ranges):
+                part_sql = "SELECT * FROM ({sql}) AS q WHERE {w} ORDER BY {k}".format(
+                    sql=sql, w=part["where"], k=split_key
+                )
+                part_file = os.path.join(
+                    tempdir,
+                    "{}_{}_{:03d}.gpkg".format(os.path.basename(tempdir), outlayer, i),
+                )
+                command = self._pg2ogr_command(
+                    part_sql,
+                    "GPKG",
+                    part_file,
+                    outlayer=outlayer,
+                    column_remap=column_remap,
+                    s_srs=s_srs,
+                    t_srs=t_srs or "EPSG:3005",
+                )
+                commands.append((part_file, command))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(
+                    executor.map(self._run_command, [c for p, c in commands])
+                )
+            for result in results:
+                if result["returncode"] != 0:
+                    raise DatasetException("ogr2ogr failed: " + result["stderr"])
+            # merge the parts in key order
+            for i, (part_file, command) in enumerate(commands):
+                command = [
+                    "ogr2ogr",
+                    "-f",
+                    driver,
+                    outfile,
+                    part_file,
+                    outlayer,
+                    "-nln",
+                    outlayer,
+                ]
+                if driver == "FileGDB":
+                    command = command + ["-nlt", geom_type]
+                if i > 0 or append:
+                    command = command + ["-update", "-append"]
+                elif os.path.exists(outfile):
+                    command = command + ["-update"]
+                result = self._run_command(command)
+                if result["returncode"] != 0:
+                    raise DatasetException("ogr2ogr failed: " + result["stderr"])
+        finally:
+            shutil.rmtree(tempdir)
+            for part_file, command in commands:
+                vrtpath = os.path.join(
+                    tempfile.gettempdir(),
+                    os.path.splitext(os.path.basename(part_file))[0] + ".vrt",
+                )
+                if os.path.exists(vrtpath):
+                    os.remove(vrtpath)
@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+import logging
+import math
+import threading
+import time
+from collections import deque
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(fraction * len(values))) - 1)]
+
+
+class Instrumentation(object):
+    """
+    Record every statement executed through the engine of a Database
+    (``execute``, ``query``, ``query_one``, ``execute_many``, ``Table.find``
+    and so on): wall time, rows returned or affected, bytes of sql sent and
+    the name of the QueryDict query the statement came from (or, for other
+    statements, its first keyword, eg ``SELECT``). Failed statements are
+    recorded too, with the exception message as ``error``.
+
+    Only the bytes sent are measured (``bytes_sent``, the sql with its
+    parameters): statements are recorded before their results are fetched,
+    and the driver does not report the size of results, so no bytes
+    received are recorded.
+
+    Timings of the last ``window`` statements of each name are kept for
+    ``stats()``. Each record is passed to the functions added with
+    ``add_hook()``. Statements slower than ``slow_threshold`` seconds are
+    logged and kept in ``slow``; with ``explain`` set, the plan of slow
+    SELECT statements is captured with EXPLAIN (ANALYZE, BUFFERS) - note
+    that this runs the query again.
+    """
+
+    def __init__(self, db, slow_threshold=None, explain=False, window=1000):
+        self.db = db
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.window = window
+        self.hooks = []
+        self.slow = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self._timings = OrderedDict()
+        self._totals = OrderedDict()
+        event.listen(db.engine, "before_cursor_execute", self._before)
+        event.listen(db.engine, "after_cursor_execute", self._after)
+        event.listen(db.engine, "handle_error", self._error)
+
+    def remove(self):
+        """Stop recording
+        """
+        event.remove(self.db.engine, "before_cursor_execute", self._before)
+        event.remove(self.db.engine, "after_cursor_execute", self._after)
+        event.remove(self.db.engine, "handle_error", self._error)
+
+    def add_hook(self, hook):
+        """Call ``hook(record)`` for every statement executed
+        """
+        self.hooks.append(hook)
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._totals.clear()
+            self.slow.clear()
+
+    def _name(self, statement):
+        name = self.db.queries.name_of(statement)
+        if name:
+            return name
+        words = statement.split(None, 1)
+        return words[0].upper() if words else ""
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("pgdata_query_start", []).append(time.time())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self._record(conn, cursor, statement, context, executemany)
+
+    def _error(self, context):
+        # pop the start time of the failed statement, and record it
+        conn = context.connection
+        if conn is None or not conn.info.get("pgdata_query_start"):
+            return
+        if context.statement is None:
+            conn.info["pgdata_query_start"].pop()
+            return
+        self._record(
+            conn,
+            context.cursor,
+            context.statement,
+            context.execution_context,
+            getattr(context.execution_context, "executemany", False),
+            error=context.original_exception,
+        )
+
+    def _record(self, conn, cursor, statement, context, executemany, error=None):
+        elapsed = time.time() - conn.info["pgdata_query_start"].pop()
+        sent = getattr(cursor, "query", None)
+        record = {
+            # the statement may have been rewritten by a StatementCache
+            "name": self._name(context.statement if context else statement),
+            "statement": statement,
+            "elapsed": elapsed,
+            "rowcount": cursor.rowcount if error is None else None,
+            "bytes_sent": len(sent) if sent else len(statement.encode("utf-8")),
+            "executemany": executemany,
+            "plan": None,
+            "error": None if error is None else str(error),
+        }
+        with self._lock:
+            name = record["name"]
+            if name not in self._timings:
+                self._timings[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0, 0]
+            self._timings[name].append(elapsed)
+            self._totals[name][0] += 1
+            self._totals[name][1] += elapsed
+            if error is not None:
+                self._totals[name][2] += 1
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            if (
+                self.explain
+                and error is None
+                and sent
+                and not executemany
+                and statement.lstrip()[:6].upper() == "SELECT"
+            ):
+                record["plan"] = self._explain(sent)
+            log.warning("slow query %s (%.3fs): %s", record["name"], elapsed, statement)
+            self.slow.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def _explain(self, sql):
+        # use a raw connection so the EXPLAIN itself is not recorded
+        conn = self.db.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + sql)
+            plan = "\n".join(r[0] for r in cursor.fetchall())
+            conn.rollback()
+            return plan
+        except Exception as e:
+            log.warning("could not explain query: %s", e)
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def stats(self):
+        """
+        Return a dict of statistics for each query name: ``count``, ``total``
+        time and ``errors`` (failed statements) for all statements, then
+        ``mean``, ``p50``, ``p95``, ``max`` and a ``histogram`` (count of
+        statements per power of two milliseconds bucket) for the last
+        ``window`` statements.
+        """
+        stats = OrderedDict()
+        with self._lock:
+            for name, timings in self._timings.items():
+                histogram = OrderedDict()
+                for t in sorted(timings):
+                    bucket = 2 ** max(0, int(math.ceil(math.log(max(t * 1000, 1), 2))))
+                    histogram[bucket] = histogram.get(bucket, 0) + 1
+                stats[name] = {
+                    "count": self._totals[name][0],
+                    "total": self._totals[name][1],
+                    "errors": self._totals[name][2],
+                    "mean": sum(timings) / len(timings),
+                    "p50": _percentile(timings, 0.5),
+                    "p95": _percentile(timings, 0.95),
+                    "max": max(timings),
+                    "histogram": histogram,
+                }
+        return stats
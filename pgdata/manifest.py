@@ -0,0 +1,168 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import os
+
+
+def source_signature(path):
+    """
+    Return the size and modification time of a file, or of all files in a
+    directory (eg a FileGDB), as a dict - None if ``path`` is not a local
+    file or directory (eg a /vsicurl/ or database source)
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+    if os.path.isdir(path):
+        size = 0
+        mtime = os.stat(path).st_mtime
+        for filename in _walk(path):
+            stat = os.stat(filename)
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+        return {"size": size, "mtime": mtime}
+
+
+def source_hash(path, buffer_size=1024 * 1024):
+    """Return the sha256 of the content of a file, or of all files in a directory
+    """
+    sha = hashlib.sha256()
+    if os.path.isdir(path):
+        filenames = list(_walk(path))
+    else:
+        filenames = [path]
+    for filename in filenames:
+        if filename != path:
+            sha.update(os.path.relpath(filename, path).encode("utf-8"))
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(buffer_size), b""):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def options_hash(options):
+    """Return a hash of ogr2pg load options (a dict), for the manifest
+    """
+    key = json.dumps(sorted(options.items()), default=str)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _walk(path):
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            yield os.path.join(root, f)
+
+
+class Manifest(object):
+    """
+    Table recording the sources loaded by ``ogr2pg(incremental=True)``: for
+    each source file, layer and target table, the size, modification time
+    and sha256 of the source, a hash of the load options, the row count of
+    the target and the load time of the last successful load.
+    """
+
+    def __init__(self, db, table="public.pgdata_manifest"):
+        self.db = db
+        self.table = table
+        self._created = False
+
+    def create(self):
+        """Create the manifest table if it does not exist
+        """
+        if not self._created:
+            self.db.execute(
+                """CREATE TABLE IF NOT EXISTS {t} (
+                     source text NOT NULL,
+                     layer text NOT NULL,
+                     target text NOT NULL,
+                     size bigint,
+                     mtime double precision,
+                     sha256 text,
+                     options text,
+                     rowcount bigint,
+                     loaded_at timestamp with time zone DEFAULT now(),
+                     PRIMARY KEY (source, layer, target))""".format(
+                    t=self.table
+                )
+            )
+            self._created = True
+
+    def get(self, source, layer, target):
+        """Return the manifest entry of a source (as a dict), or None
+        """
+        self.create()
+        row = self.db.query_one(
+            """SELECT source, layer, target, size, mtime, sha256, options, rowcount,
+                 loaded_at
+               FROM {t}
+               WHERE source = %s AND layer = %s AND target = %s""".format(
+                t=self.table
+            ),
+            (source, layer, target),
+        )
+        if row is not None:
+            return dict(row.items())
+
+    def unchanged(self, entry, path, signature, options=None):
+        """
+        Check if the source at ``path`` is unchanged since the load recorded
+        in ``entry``: it is not if it is loaded with other ``options`` (see
+        options_hash), it is if its size and modification time are the
+        same, otherwise if its content hash is the same. Returns a tuple
+        (unchanged, sha256), sha256 being None if it was not computed.
+        """
+        if entry is None or signature is None or entry["options"] != options:
+            return False, None
+        if (entry["size"], entry["mtime"]) == (signature["size"], signature["mtime"]):
+            return True, entry["sha256"]
+        if entry["size"] != signature["size"]:
+            return False, None
+        sha256 = source_hash(path)
+        return sha256 == entry["sha256"], sha256
+
+    def record(self, source, layer, target, signature, sha256, rowcount, options=None):
+        """Record a successful load of a source
+        """
+        self.create()
+        signature = signature or {}
+        self.db.execute(
+            """INSERT INTO {t}
+                 (source, layer, target, size, mtime, sha256, options, rowcount,
+                  loaded_at)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, now())
+               ON CONFLICT (source, layer, target) DO UPDATE SET
+                 size = EXCLUDED.size,
+                 mtime = EXCLUDED.mtime,
+                 sha256 = EXCLUDED.sha256,
+                 options = EXCLUDED.options,
+                 rowcount = EXCLUDED.rowcount,
+                 loaded_at = EXCLUDED.loaded_at""".format(
+                t=self.table
+            ),
+            (
+                source,
+                layer,
+                target,
+                signature.get("size"),
+                signature.get("mtime"),
+                sha256,
+                options,
+                rowcount,
+            ),
+        )
+
+    def forget(self, target, source=None, layer=None):
+        """
+        Remove the entries of ``target``, except the one of ``source`` and
+        ``layer`` if given, so that the other sources of the target are
+        loaded again
+        """
+        self.create()
+        self.db.execute(
+            """DELETE FROM {t}
+               WHERE target = %s AND NOT (source = %s AND layer = %s)""".format(
+                t=self.table
+            ),
+            (target, source or "", layer or ""),
+        )
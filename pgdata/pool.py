@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+import logging
+import os
+import threading
+import time
+import weakref
+
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import QueuePool
+
+log = logging.getLogger(__name__)
+
+# pools inherited from a parent process, kept so that their connections
+# (which belong to the parent) are never closed by the child
+_inherited_pools = []
+
+# fork safe engines (and their PoolStats), reset by the single at fork hook
+_fork_safe_engines = weakref.WeakKeyDictionary()
+
+
+class PoolStats(object):
+    """Counters of connection pool events
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {
+                "checkouts": 0,
+                "checkins": 0,
+                "connects": 0,
+                "invalidations": 0,
+                "waits": 0,
+                "wait_time": 0.0,
+            }
+
+    def add(self, key, value=1):
+        with self._lock:
+            self.counts[key] += value
+
+    def listen(self, engine):
+        event.listen(engine, "connect", lambda *a: self.add("connects"))
+        event.listen(engine, "checkout", lambda *a: self.add("checkouts"))
+        event.listen(engine, "checkin", lambda *a: self.add("checkins"))
+        event.listen(engine, "invalidate", lambda *a: self.add("invalidations"))
+
+
+class StatsQueuePool(QueuePool):
+    """
+    QueuePool recording in ``stats`` (a PoolStats) how many checkouts had
+    to wait for a connection to be returned, and for how long
+    """
+
+    stats = None
+
+    def _do_get(self):
+        exhausted = (
+            self._max_overflow > -1
+            and self._overflow >= self._max_overflow
+            and self._pool.empty()
+        )
+        if not exhausted or self.stats is None:
+            return super(StatsQueuePool, self)._do_get()
+        start = time.time()
+        try:
+            return super(StatsQueuePool, self)._do_get()
+        finally:
+            self.stats.add("waits")
+            self.stats.add("wait_time", time.time() - start)
+
+    def recreate(self):
+        pool = super(StatsQueuePool, self).recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def _set_pid(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+def _check_pid(dbapi_connection, connection_record, connection_proxy):
+    pid = os.getpid()
+    if connection_record.info["pid"] != pid:
+        # drop the connection without closing it, it belongs to the parent
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            "Connection record belongs to pid %s, attempting to check out in pid %s"
+            % (connection_record.info["pid"], pid)
+        )
+
+
+def _reset_after_fork():
+    for engine, stats in list(_fork_safe_engines.items()):
+        _inherited_pools.append(engine.pool)
+        engine.pool = engine.pool.recreate()
+        if stats is not None:
+            stats.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_pool_engine(
+    url,
+    pool_size=5,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_recycle=-1,
+    pool_pre_ping=False,
+    fork_safe=False,
+    stats=None,
+):
+    """
+    Create an engine with a StatsQueuePool reporting to ``stats`` (or with a
+    NullPool, if ``pool_size`` is 0).
+
+    With ``fork_safe``, connections are tagged with the pid of the process
+    that opened them: a forked child process starts with a new, empty pool
+    and never uses (or closes) the connections of its parent.
+    """
+    if pool_size == 0:
+        engine = create_engine(url, poolclass=NullPool, pool_pre_ping=pool_pre_ping)
+    else:
+        engine = create_engine(
+            url,
+            poolclass=StatsQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+        )
+        engine.pool.stats = stats
+    if stats is not None:
+        stats.listen(engine)
+    if fork_safe:
+        event.listen(engine, "connect", _set_pid)
+        event.listen(engine, "checkout", _check_pid)
+        _fork_safe_engines[engine] = stats
+    return engine
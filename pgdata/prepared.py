@@ -0,0 +1,267 @@
+from __future__ import absolute_import
+import logging
+import re
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from hashlib import sha1
+
+import six
+from sqlalchemy import event
+
+from .util import is_ddl
+
+log = logging.getLogger(__name__)
+
+# psycopg2 placeholders, and the %% escape of a literal %
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+_PREPARABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "VALUES")
+
+STALE_PLAN = "cached plan must not change result type"
+
+_INTEGER_TYPES = ("smallint", "integer", "bigint")
+_NUMBER_TYPES = ("numeric", "real", "double precision")
+
+
+def is_stale_plan_error(error):
+    """Check if an exception is raised by a plan invalidated by a DDL change
+    """
+    return STALE_PLAN in str(getattr(error, "orig", error))
+
+
+def convert_placeholders(statement):
+    """
+    Convert the psycopg2 placeholders of a statement to $n parameters.
+    Returns a tuple (sql, placeholders): the sql to PREPARE and the
+    placeholders to EXECUTE it with, in order - or None if the statement
+    has no placeholders or mixes named and positional ones.
+    """
+    names = OrderedDict()
+    positional = []
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is None:
+            positional.append("%s")
+            return "$%s" % len(positional)
+        name = match.group(1)
+        if name not in names:
+            names[name] = "%%(%s)s" % name
+        return "$%s" % (list(names).index(name) + 1)
+
+    sql = _PLACEHOLDER.sub(replace, statement)
+    if bool(names) == bool(positional):
+        return None
+    return sql, list(names.values()) or positional
+
+
+def parameter_matches(value, type_name):
+    """
+    Check if running a statement with ``value`` for a parameter the server
+    inferred as ``type_name`` gives the same result as psycopg2's literal:
+    strings and NULL are untyped literals, resolved from the context like
+    parameters, numbers and other values are typed (eg ``SELECT %s`` is an
+    integer for 5, not the text a prepared ``SELECT $1`` would return)
+    """
+    if value is None or isinstance(value, six.string_types):
+        return True
+    if isinstance(value, bool):
+        return type_name == "boolean"
+    if isinstance(value, six.integer_types):
+        return type_name in _INTEGER_TYPES + _NUMBER_TYPES
+    if isinstance(value, (float, Decimal)):
+        return type_name in _NUMBER_TYPES
+    return type_name not in ("text", "unknown")
+
+
+class StatementCache(object):
+    """
+    Run the parameterized statements executed through the engine of a
+    Database (``execute``, ``query``, ``query_one``, ``Table.find`` and so
+    on) as server side prepared statements: the first time a statement is
+    run on a connection it is PREPAREd, after that only EXECUTE is sent and
+    Postgres reuses the parsed (and, after a few runs, the planned)
+    statement.
+
+    Statements are keyed by their sql with placeholders, the parameters are
+    not part of the key. Each connection keeps at most ``size`` prepared
+    statements, the least recently used are DEALLOCATEd. Statements that
+    cannot be prepared, or whose parameter types as inferred by Postgres
+    would change the results (eg ``SELECT %s AS x``, text when prepared),
+    are run as usual and not tried again, see ``parameter_matches``.
+
+    DDL run through the engine deallocates all statements on all
+    connections; DDL from elsewhere that changes the result columns of a
+    prepared statement makes its next execution fail (see
+    ``is_stale_plan_error``), after which all statements are deallocated.
+    ``Database.execute``, ``query`` and ``query_one`` retry once on that
+    error.
+    """
+
+    def __init__(self, db, size=100):
+        self.db = db
+        self.size = size
+        # bumped to deallocate the statements of all connections
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._unpreparable = set()
+        self.reset()
+        event.listen(db.engine, "before_cursor_execute", self._before, retval=True)
+        event.listen(db.engine, "handle_error", self._error)
+
+    def remove(self):
+        """Stop preparing statements (already prepared ones are not deallocated)
+        """
+        event.remove(self.db.engine, "before_cursor_execute", self._before)
+        event.remove(self.db.engine, "handle_error", self._error)
+
+    def reset(self):
+        with self._lock:
+            self.counts = {
+                "hits": 0,
+                "misses": 0,
+                "evictions": 0,
+                "unpreparable": 0,
+                "invalidations": 0,
+            }
+
+    def invalidate(self):
+        """Deallocate the prepared statements of all connections
+        """
+        with self._lock:
+            self.generation += 1
+            self.counts["invalidations"] += 1
+
+    def stats(self):
+        """
+        Return the counts of ``hits`` (statements run from a prepared
+        statement), ``misses`` (statements prepared), ``evictions``,
+        ``unpreparable`` statements and ``invalidations``, and the
+        ``hit_rate``
+        """
+        with self._lock:
+            stats = dict(self.counts)
+        executed = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / float(executed) if executed else 0.0
+        return stats
+
+    def _add(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _statements(self, conn, cursor):
+        """
+        Return the OrderedDict of statements prepared on the DBAPI
+        connection of ``conn``, deallocating them first if the cache was
+        invalidated
+        """
+        dbapi_conn = cursor.connection
+        info = conn.connection.info
+        cached = info.get("pgdata_prepared")
+        if cached is not None and cached[0] is dbapi_conn:
+            if cached[1] == self.generation:
+                return cached[2]
+            dbapi_conn.cursor().execute("DEALLOCATE ALL")
+        statements = OrderedDict()
+        info["pgdata_prepared"] = (dbapi_conn, self.generation, statements)
+        return statements
+
+    def _prepare(self, cursor, name, sql):
+        """
+        PREPARE a statement, returning the names of its parameter types - or
+        None if it cannot be prepared
+        """
+        prepare = "PREPARE {n} AS {q}".format(n=name, q=sql)
+        dbapi_conn = cursor.connection
+        if dbapi_conn.autocommit:
+            try:
+                dbapi_conn.cursor().execute(prepare)
+            except Exception as e:
+                log.debug("could not prepare statement: %s", e)
+                return None
+        else:
+            # in a transaction, a failing PREPARE must not abort it
+            try:
+                dbapi_conn.cursor().execute(
+                    "SAVEPOINT pgdata_prepare; {p}; "
+                    "RELEASE SAVEPOINT pgdata_prepare".format(p=prepare)
+                )
+            except Exception as e:
+                log.debug("could not prepare statement: %s", e)
+                dbapi_conn.cursor().execute("ROLLBACK TO SAVEPOINT pgdata_prepare")
+                return None
+        types = dbapi_conn.cursor()
+        types.execute(
+            """SELECT parameter_types::text[] FROM pg_prepared_statements
+               WHERE name = %s""",
+            (name,),
+        )
+        return types.fetchone()[0]
+
+    @staticmethod
+    def _matches(prepared, parameters):
+        """Check if a prepared statement gives the same results as the statement
+        """
+        name, placeholders, types = prepared
+        if isinstance(parameters, dict):
+            values = [parameters[p[2:-2]] for p in placeholders]
+        else:
+            values = list(parameters)
+        return all(parameter_matches(v, t) for v, t in zip(values, types))
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if is_ddl(statement):
+            self.invalidate()
+            return statement, parameters
+        first = statement.lstrip()[:8].upper()
+        if (
+            executemany
+            or not parameters
+            or not first.startswith(_PREPARABLE)
+            or getattr(cursor, "name", None)
+            or "$" in statement
+        ):
+            return statement, parameters
+        key = statement.strip()
+        if key in self._unpreparable:
+            return statement, parameters
+        statements = self._statements(conn, cursor)
+        prepared = statements.get(key)
+        if prepared is not None:
+            statements.move_to_end(key)
+            if not self._matches(prepared, parameters):
+                return statement, parameters
+            self._add("hits")
+        else:
+            converted = convert_placeholders(key)
+            name = "pgdata_" + sha1(key.encode("utf-8")).hexdigest()[:16]
+            types = None
+            if converted is not None:
+                types = self._prepare(cursor, name, converted[0])
+            if types is not None:
+                prepared = (name, converted[1], types)
+                if not self._matches(prepared, parameters):
+                    cursor.connection.cursor().execute("DEALLOCATE " + name)
+                    types = None
+            if types is None:
+                if len(self._unpreparable) >= 1000:
+                    self._unpreparable.clear()
+                self._unpreparable.add(key)
+                if converted is not None:
+                    self._add("unpreparable")
+                return statement, parameters
+            statements[key] = prepared
+            self._add("misses")
+            if len(statements) > self.size:
+                evicted = statements.popitem(last=False)[1][0]
+                cursor.connection.cursor().execute("DEALLOCATE " + evicted)
+                self._add("evictions")
+        name, placeholders, types = prepared
+        return "EXECUTE {n}({p})".format(n=name, p=", ".join(placeholders)), parameters
+
+    def _error(self, context):
+        if is_stale_plan_error(context.original_exception):
+            log.info("prepared statement invalidated by a DDL change")
+            self.invalidate()
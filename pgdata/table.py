@@ -1,25 +1,24 @@
 from __future__ import absolute_import
 import itertools
 import six
+import uuid
 from hashlib import sha1
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
 from itertools import count
 
-from sqlalchemy import create_engine
 from sqlalchemy.schema import Table as SQLATable
-from sqlalchemy.schema import MetaData
 from sqlalchemy.schema import Column, Index
-from sqlalchemy.sql import and_, expression, text
+from sqlalchemy.sql import and_, any_, bindparam, expression, text, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy import alias
-
-from alembic.migration import MigrationContext
-from alembic.operations import Operations
-
-# load custom types to stop sqlalchemy from complaining
-from geoalchemy2 import Geometry
-from sqlalchemy_utils import LtreeType
+from sqlalchemy import func
 
 from pgdata.util import DatasetException
+from pgdata.util import convert_rows
+from pgdata.util import copy_converter
 from pgdata.util import normalize_column_name
 from pgdata.util import ResultIter
 from six.moves import map
@@ -27,27 +26,42 @@ from six.moves import map
 log = logging.getLogger(__name__)
 
 
+class _Page(object):
+    """A fetched page of results, consumable by ResultIter
+    """
+
+    def __init__(self, result_proxy):
+        self._keys = result_proxy.keys()
+        self.rows = result_proxy.fetchall()
+
+    def keys(self):
+        return self._keys
+
+    def fetchall(self):
+        return self.rows
+
+
 class Table(object):
     def __init__(self, db, schema, table, columns=None):
         self.db = db
         self.schema = schema
         self.name = table
-        self.engine = create_engine(db.url)
-        self.metadata = MetaData(schema=schema)
-        self.metadata.bind = self.engine
+        # share the engine and MetaData of the database
+        self.engine = db.engine
+        self.metadata = db.metadata
         # http://docs.sqlalchemy.org/en/rel_1_0/core/metadata.html
         # if provided columns (SQLAlchemy columns), create the table
         if table:
             if columns:
+                db.invalidate_table(schema, table)
                 self.table = SQLATable(
                     table, self.metadata, schema=self.schema, *columns
                 )
                 self.table.create()
-            # otherwise just load from db
+                db.catalog.invalidate()
+            # otherwise just load from db (or the db's reflection cache)
             else:
-                self.table = SQLATable(
-                    table, self.metadata, schema=self.schema, autoload=True
-                )
+                self.table = db.reflect_table(schema, table)
             self.indexes = dict((i.name, i) for i in self.table.indexes)
             self._is_dropped = False
         else:
@@ -87,9 +101,22 @@ class Table(object):
 
     @property
     def op(self):
+        from alembic.migration import MigrationContext
+        from alembic.operations import Operations
+
         ctx = MigrationContext.configure(self.engine.connect())
         return Operations(ctx)
 
+    @contextmanager
+    def _op(self):
+        """Alembic operations on a connection that is released when done
+        """
+        from alembic.migration import MigrationContext
+        from alembic.operations import Operations
+
+        with self.engine.connect() as conn:
+            yield Operations(MigrationContext.configure(conn))
+
     def _valid_table_name(self, table_name):
         """Check if the table name is obviously invalid.
         """
@@ -98,9 +125,7 @@ class Table(object):
         return table_name.strip()
 
     def _update_table(self, table_name):
-        self.metadata = MetaData(schema=self.schema)
-        self.metadata.bind = self.engine
-        return SQLATable(table_name, self.metadata, schema=self.schema)
+        return self.db.reflect_table(self.schema, table_name, refresh=True)
 
     def add_primary_key(self, column="id"):
         """Add primary key constraint to specified column
@@ -118,6 +143,7 @@ class Table(object):
         """
         if self._is_dropped is False:
             self.table.drop(self.engine)
+            self.db.invalidate_table(self.schema, self.name)
         self._is_dropped = True
 
     def _check_dropped(self):
@@ -145,7 +171,8 @@ class Table(object):
         """
         self._check_dropped()
         if normalize_column_name(name) not in self._normalized_columns:
-            self.op.add_column(self.table.name, Column(name, type), self.table.schema)
+            with self._op() as op:
+                op.add_column(self.table.name, Column(name, type), self.table.schema)
             self.table = self._update_table(self.table.name)
 
     def drop_column(self, name):
@@ -157,15 +184,28 @@ class Table(object):
         """
         self._check_dropped()
         if name in list(self.table.columns.keys()):
-            self.op.drop_column(self.table.name, name, schema=self.schema)
+            with self._op() as op:
+                op.drop_column(self.table.name, name, schema=self.schema)
             self.table = self._update_table(self.table.name)
 
-    def create_index(self, columns, name=None, index_type="btree"):
+    def create_index(
+        self,
+        columns,
+        name=None,
+        index_type="btree",
+        concurrently=False,
+        maintenance_work_mem=None,
+        parallel_workers=None,
+    ):
         """
         Create an index to speed up queries on a table.
         If no ``name`` is given a random name is created.
         ::
             table.create_index(['name', 'country'])
+        With ``concurrently=True`` the index is built with CREATE INDEX
+        CONCURRENTLY, which does not block writes to the table.
+        ``maintenance_work_mem`` (eg ``"2GB"``) and ``parallel_workers``
+        (``max_parallel_maintenance_workers``) apply to this build only.
         """
         self._check_dropped()
         if not name:
@@ -180,21 +220,48 @@ class Table(object):
             name = "ix_%s_%s" % (self.table.name, key)
         if name in self.indexes:
             return self.indexes[name]
-        # self.db._acquire()
         columns = [self.table.c[col] for col in columns]
-        idx = Index(name, *columns, postgresql_using=index_type)
-        idx.create(self.engine)
-        # finally:
-        #    self.db._release()
+        idx = Index(
+            name,
+            *columns,
+            postgresql_using=index_type,
+            postgresql_concurrently=concurrently
+        )
+        settings = {}
+        if maintenance_work_mem is not None:
+            settings["maintenance_work_mem"] = maintenance_work_mem
+        if parallel_workers is not None:
+            settings["max_parallel_maintenance_workers"] = parallel_workers
+        # CONCURRENTLY can not run in a transaction block
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            for setting, value in settings.items():
+                conn.execute("SELECT set_config(%s, %s, false)", (setting, str(value)))
+            # settings are per session, reset them before the connection
+            # goes back to the pool
+            try:
+                idx.create(conn)
+            except Exception:
+                # a failing RESET (eg on a broken connection) must not hide
+                # the original error
+                try:
+                    for setting in settings:
+                        conn.execute("RESET " + setting)
+                except Exception as e:
+                    log.warning("could not reset %s: %s", ", ".join(settings), e)
+                raise
+            for setting in settings:
+                conn.execute("RESET " + setting)
+        self.db.catalog.invalidate()
         self.indexes[name] = idx
         return idx
 
-    def create_index_geom(self, column="geom"):
+    def create_index_geom(self, column="geom", **kwargs):
         """Shortcut to create index on geometry
         """
-        self.create_index([column], index_type="gist")
+        self.create_index([column], index_type="gist", **kwargs)
 
-    def distinct(self, *columns, **_filter):
+    def distinct(self, *columns, _stream=False, _step=5000, **_filter):
         """
         Returns all rows of a table, but removes rows in with duplicate values in ``columns``.
         Interally this creates a `DISTINCT statement <http://www.w3schools.com/sql/sql_distinct.asp>`_.
@@ -206,6 +273,8 @@ class Table(object):
             table.distinct('year', 'country')
             # you can also combine this with a filter
             table.distinct('year', country='China')
+        Use ``_stream=True`` to fetch the results ``_step`` rows at a time
+        through a server side cursor.
         """
         self._check_dropped()
         qargs = []
@@ -222,12 +291,18 @@ class Table(object):
             whereclause=and_(*qargs),
             order_by=[c.asc() for c in columns],
         )
+        if _stream:
+            rp = self.db.stream_engine(_step).execute(q)
+        else:
+            rp = self.engine.execute(q)
         # if just looking at one column, return a simple list
         if len(columns) == 1:
-            return itertools.chain.from_iterable(self.engine.execute(q))
+            return itertools.chain.from_iterable(rp)
         # otherwise return specified row_type
         else:
-            return ResultIter(self.engine.execute(q), row_type=self.db.row_type)
+            return ResultIter(
+                rp, row_type=self.db.row_type, batch_size=_step if _stream else None
+            )
 
     def insert(self, row):
         """
@@ -240,10 +315,11 @@ class Table(object):
         """
         self._check_dropped()
         res = self.engine.execute(self.table.insert(row))
+        self.db.invalidate_counts(self.schema, self.name)
         if len(res.inserted_primary_key) > 0:
             return res.inserted_primary_key[0]
 
-    def insert_many(self, rows, chunk_size=1000):
+    def insert_many(self, rows, chunk_size=1000, method="insert"):
         """
         Add many rows at a time, which is significantly faster than adding
         them one by one. Per default the rows are processed in chunks of
@@ -253,12 +329,19 @@ class Table(object):
         ::
             rows = [dict(name='Dolly')] * 10000
             table.insert_many(rows)
+        Use ``method="copy"`` to load the rows with COPY FROM STDIN
+        (see :py:meth:`copy_in() <pgdata.Table.copy_in>`), which is much
+        faster for large loads.
         """
 
         def _process_chunk(chunk):
             self.table.insert().execute(chunk)
 
         self._check_dropped()
+        if method == "copy":
+            return self.copy_in(rows, chunk_size=chunk_size)
+        elif method != "insert":
+            raise ValueError("Invalid insert method: %r" % method)
 
         chunk = []
         for i, row in enumerate(rows, start=1):
@@ -268,6 +351,372 @@ class Table(object):
                 chunk = []
         if chunk:
             _process_chunk(chunk)
+        self.db.invalidate_counts(self.schema, self.name)
+
+    def _copy_rows(self, cursor, rows, columns=None, chunk_size=10000, target=None):
+        """
+        Stream rows into ``target`` (default this table) with COPY FROM STDIN,
+        sending one buffer of ``chunk_size`` rows at a time.
+        Returns the number of rows copied.
+        """
+        rows = iter(rows)
+        try:
+            first = next(rows)
+        except StopIteration:
+            return 0
+        is_dict = isinstance(first, dict)
+        if columns is None:
+            columns = list(first.keys()) if is_dict else self.columns
+        column_types = self.column_types
+        converters = [copy_converter(column_types[c]) for c in columns]
+        preparer = self.engine.dialect.identifier_preparer
+        if target is None:
+            target = preparer.format_table(self.table)
+        sql = "COPY {t} ({c}) FROM STDIN".format(
+            t=target, c=", ".join(preparer.quote(c) for c in columns)
+        )
+
+        n = 0
+        buf = six.StringIO()
+        for row in itertools.chain((first,), rows):
+            if is_dict:
+                values = [row.get(c) for c in columns]
+            else:
+                values = row
+            buf.write(
+                "\t".join(
+                    "\\N" if v is None else f(v) for f, v in zip(converters, values)
+                )
+            )
+            buf.write("\n")
+            n += 1
+            if n % chunk_size == 0:
+                buf.seek(0)
+                cursor.copy_expert(sql, buf)
+                buf = six.StringIO()
+        if n % chunk_size:
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+        return n
+
+    def copy_in(self, rows, columns=None, chunk_size=10000):
+        """
+        Load rows (dicts or tuples) from any iterable with COPY FROM STDIN.
+        Values are converted according to the reflected ``column_types``,
+        geometry columns take WKB or WKT. Tuples are matched to ``columns``
+        (default all columns of the table). Only one buffer of ``chunk_size``
+        rows is held in memory, all buffers are loaded in a single transaction.
+        ::
+            table.copy_in(row for row in reader)
+        Returns the number of rows loaded.
+        """
+        self._check_dropped()
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            n = self._copy_rows(cursor, rows, columns=columns, chunk_size=chunk_size)
+            conn.commit()
+        finally:
+            conn.close()
+        self.db.invalidate_counts(self.schema, self.name)
+        return n
+
+    def _execute_ddl(self, statements, settings=None):
+        """
+        Run statements in one transaction on a raw connection (so that
+        index definitions are passed to the server as they are), with
+        ``settings`` applied to the transaction only
+        """
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            for setting, value in (settings or {}).items():
+                cursor.execute("SELECT set_config(%s, %s, true)", (setting, str(value)))
+            for sql in statements:
+                cursor.execute(sql)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _bulk_load_definitions(self):
+        """
+        Return the indexes (with the constraints they back) and the foreign
+        keys of the table that can be dropped for a bulk load. Unique
+        indexes referenced by foreign keys of other tables are left alone.
+        """
+        regclass = self._regclass()
+        indexes = self.engine.execute(
+            """SELECT i.relname AS name,
+                      x.indexrelid::regclass::text AS regclass,
+                      pg_get_indexdef(x.indexrelid) AS indexdef,
+                      con.conname AS constraint,
+                      con.contype,
+                      con.condeferrable AS deferrable,
+                      pg_get_constraintdef(con.oid) AS condef
+               FROM pg_index x
+               INNER JOIN pg_class i ON x.indexrelid = i.oid
+               LEFT OUTER JOIN pg_constraint con
+               ON con.conindid = x.indexrelid
+               AND con.conrelid = x.indrelid
+               AND con.contype IN ('p', 'u', 'x')
+               WHERE x.indrelid = %s::regclass
+               AND NOT EXISTS (
+                 SELECT 1 FROM pg_constraint f
+                 WHERE f.contype = 'f'
+                 AND f.conindid = x.indexrelid
+                 AND f.conrelid <> x.indrelid)
+               ORDER BY i.relname""",
+            (regclass,),
+        ).fetchall()
+        foreign_keys = self.engine.execute(
+            """SELECT conname, pg_get_constraintdef(oid)
+               FROM pg_constraint
+               WHERE conrelid = %s::regclass AND contype = 'f'
+               ORDER BY conname""",
+            (regclass,),
+        ).fetchall()
+        return [dict(r) for r in indexes], [tuple(r) for r in foreign_keys]
+
+    @contextmanager
+    def bulk_load(
+        self, unlogged=False, workers=4, maintenance_work_mem=None, analyze=True
+    ):
+        """
+        Context manager for loading large amounts of data into a table with
+        indexes and keys: the indexes, primary key, unique and exclusion
+        constraints and foreign keys are dropped (and, with ``unlogged=True``,
+        the table is made UNLOGGED) for the duration of the load. On exit,
+        whether or not the load succeeded, the table is made LOGGED again
+        (unless it was already UNLOGGED),
+        the indexes are rebuilt in parallel (``workers`` at a time, with
+        ``maintenance_work_mem`` per build), the constraints are added back
+        and the table is analyzed.
+        ::
+            with table.bulk_load(unlogged=True):
+                table.copy_in(rows)
+        """
+        self._check_dropped()
+        table = self._regclass()
+        preparer = self.engine.dialect.identifier_preparer
+        indexes, foreign_keys = self._bulk_load_definitions()
+
+        drop = [
+            "ALTER TABLE {t} DROP CONSTRAINT {c}".format(t=table, c=preparer.quote(c))
+            for c, definition in foreign_keys
+        ]
+        for index in indexes:
+            if index["constraint"]:
+                drop.append(
+                    "ALTER TABLE {t} DROP CONSTRAINT {c}".format(
+                        t=table, c=preparer.quote(index["constraint"])
+                    )
+                )
+            else:
+                drop.append("DROP INDEX {i}".format(i=index["regclass"]))
+        # a table that is already unlogged stays so
+        if unlogged:
+            persistence = self.db.query_one(
+                "SELECT relpersistence FROM pg_class WHERE oid = %s::regclass", (table,)
+            )[0]
+            unlogged = persistence == "p"
+        if unlogged:
+            drop.append("ALTER TABLE {t} SET UNLOGGED".format(t=table))
+
+        # indexes are built in parallel, then attached to their constraints
+        builds = []
+        restore = []
+        for index in indexes:
+            constraint = index["constraint"]
+            if not constraint:
+                builds.append(index["indexdef"])
+            elif index["contype"] in ("p", "u") and not index["deferrable"]:
+                builds.append(index["indexdef"])
+                restore.append(
+                    "ALTER TABLE {t} ADD CONSTRAINT {c} {k} USING INDEX {i}".format(
+                        t=table,
+                        c=preparer.quote(constraint),
+                        k="PRIMARY KEY" if index["contype"] == "p" else "UNIQUE",
+                        i=preparer.quote(index["name"]),
+                    )
+                )
+            else:
+                restore.append(
+                    "ALTER TABLE {t} ADD CONSTRAINT {c} {d}".format(
+                        t=table, c=preparer.quote(constraint), d=index["condef"]
+                    )
+                )
+        restore.extend(
+            "ALTER TABLE {t} ADD CONSTRAINT {c} {d}".format(
+                t=table, c=preparer.quote(c), d=definition
+            )
+            for c, definition in foreign_keys
+        )
+
+        self._execute_ddl(drop)
+        self.db.invalidate_table(self.schema, self.name)
+        self.table = self._update_table(self.name)
+        try:
+            yield self
+        finally:
+            try:
+                if unlogged:
+                    self._execute_ddl(["ALTER TABLE {t} SET LOGGED".format(t=table)])
+                settings = {}
+                if maintenance_work_mem is not None:
+                    settings["maintenance_work_mem"] = maintenance_work_mem
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(self._execute_ddl, [sql], settings)
+                        for sql in builds
+                    ]
+                    for future in futures:
+                        future.result()
+                self._execute_ddl(restore)
+                if analyze:
+                    self._execute_ddl(["ANALYZE {t}".format(t=table)])
+            except Exception:
+                log.error(
+                    "could not restore %s after bulk load, statements to run:\n%s",
+                    table,
+                    ";\n".join(builds + restore),
+                )
+                raise
+            finally:
+                self.db.invalidate_table(self.schema, self.name)
+                self.table = self._update_table(self.name)
+                self.indexes = dict((i.name, i) for i in self.table.indexes)
+
+    def upsert_many(self, rows, keys=None, columns=None, chunk_size=10000):
+        """
+        Insert or update many rows (dicts or tuples) in a single transaction:
+        the rows are loaded with COPY into a temporary staging table, then
+        merged into the table with one INSERT ... ON CONFLICT DO UPDATE.
+        Rows are matched on ``keys`` (default the primary key), which must
+        have a unique constraint or index. If a key appears more than once
+        in ``rows``, the last row wins.
+        ::
+            counts = table.upsert_many(rows, keys=["station_id"])
+        Returns a dict with the number of ``inserted`` and ``updated`` rows.
+        """
+        self._check_dropped()
+        keys = keys or self.primary_key
+        if not keys:
+            raise ValueError("No keys given and table %s has no primary key" % self.name)
+        if isinstance(keys, six.string_types):
+            keys = [keys]
+        rows = iter(rows)
+        try:
+            first = next(rows)
+        except StopIteration:
+            return {"inserted": 0, "updated": 0}
+        if columns is None:
+            columns = list(first.keys()) if isinstance(first, dict) else self.columns
+        missing = [k for k in keys if k not in columns]
+        if missing:
+            raise ValueError("Key columns missing from rows: %s" % ", ".join(missing))
+
+        preparer = self.engine.dialect.identifier_preparer
+        quoted = ", ".join(preparer.quote(c) for c in columns)
+        quoted_keys = ", ".join(preparer.quote(k) for k in keys)
+        stage = preparer.quote("pgdata_stage_" + uuid.uuid4().hex)
+        updates = [
+            "{c} = EXCLUDED.{c}".format(c=preparer.quote(c))
+            for c in columns
+            if c not in keys
+        ]
+        if updates:
+            on_conflict = "DO UPDATE SET " + ", ".join(updates)
+        else:
+            on_conflict = "DO NOTHING"
+        # xmax is 0 for rows inserted by the statement, set for updated rows
+        sql = """
+            WITH upserted AS (
+              INSERT INTO {t} ({c})
+              SELECT DISTINCT ON ({k}) {c}
+              FROM {s}
+              ORDER BY {k}, ctid DESC
+              ON CONFLICT ({k}) {on_conflict}
+              RETURNING xmax = 0 AS inserted
+            )
+            SELECT
+              count(*) FILTER (WHERE inserted),
+              count(*) FILTER (WHERE NOT inserted)
+            FROM upserted
+        """.format(
+            t=preparer.format_table(self.table),
+            c=quoted,
+            k=quoted_keys,
+            s=stage,
+            on_conflict=on_conflict,
+        )
+
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            # staging table with the columns (but none of the constraints)
+            # of the target table, dropped at the end of the transaction
+            cursor.execute(
+                "CREATE TEMPORARY TABLE {s} ON COMMIT DROP AS "
+                "SELECT {c} FROM {t} WITH NO DATA".format(
+                    s=stage, c=quoted, t=preparer.format_table(self.table)
+                )
+            )
+            self._copy_rows(
+                cursor,
+                itertools.chain((first,), rows),
+                columns=columns,
+                chunk_size=chunk_size,
+                target=stage,
+            )
+            cursor.execute(sql)
+            inserted, updated = cursor.fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.db.invalidate_counts(self.schema, self.name)
+        return {"inserted": inserted, "updated": updated}
+
+    def copy_out(
+        self,
+        out_file,
+        columns=None,
+        order_by=None,
+        format="csv",
+        header=True,
+        compression=None,
+        **_filter
+    ):
+        """
+        Export the rows matching a simple filter (as with ``find()``) with
+        COPY TO STDOUT, see :py:meth:`Database.copy_out() <pgdata.Database.copy_out>`.
+        ::
+            table.copy_out("streams.csv.gz", columns=["id", "name"], active=True)
+        Returns the number of rows exported.
+        """
+        self._check_dropped()
+        if columns:
+            query = expression.select([self.table.c[c] for c in columns])
+        else:
+            query = self.table.select()
+        if _filter:
+            query = query.where(self._args_to_clause(_filter))
+        if order_by:
+            if not isinstance(order_by, (list, tuple)):
+                order_by = [order_by]
+            query = query.order_by(*[self._args_to_order_by(o) for o in order_by])
+        return self.db.copy_out(
+            query,
+            out_file,
+            format=format,
+            header=header,
+            compression=compression,
+        )
 
     def rename(self, name):
         """Rename the table
@@ -277,7 +726,9 @@ class Table(object):
             s=self.schema, t=self.name, name=name
         )
         self.engine.execute(sql)
-        self.table = SQLATable(name, self.metadata, schema=self.schema, autoload=True)
+        self.db.invalidate_table(self.schema, self.name)
+        self.name = name
+        self.table = self.db.reflect_table(self.schema, name, refresh=True)
 
     def find_one(self, **kwargs):
         """
@@ -292,17 +743,146 @@ class Table(object):
         except StopIteration:
             return None
 
+    def find_many(self, column, values, batch_size=10000, **_filter):
+        """
+        Look up many values of ``column`` at once: rather than a query per
+        value, values are sent ``batch_size`` at a time as a single array
+        parameter (``column = ANY(%s)``). Other keyword arguments filter the
+        rows as in :py:meth:`find() <dataset.Table.find>`.
+
+        Returns an OrderedDict of the rows matching each value (as a list),
+        in the order of ``values``. Values matching no rows are left out.
+        ::
+            rows = table.find_many("id", ids)
+        """
+        self._check_dropped()
+        col = self.table.c[column]
+        args = self._args_to_clause(_filter)
+        order_by = [col] + [self.table.c[c] for c in self.primary_key if c != column]
+        values = list(OrderedDict.fromkeys(v for v in values if v is not None))
+        found = {}
+        for i in range(0, len(values), batch_size):
+            batch = bindparam(
+                "values", values[i : i + batch_size], type_=ARRAY(col.type)
+            )
+            q = self.table.select(
+                whereclause=and_(args, col == any_(batch)), order_by=order_by
+            )
+            rp = self.engine.execute(q)
+            keys = rp.keys()
+            index = keys.index(column)
+            rows = rp.fetchall()
+            for row, converted in zip(
+                rows, convert_rows(self.db.row_type, keys, rows)
+            ):
+                found.setdefault(row[index], []).append(converted)
+        return OrderedDict((v, found[v]) for v in values if v in found)
+
+    def get_many(self, column, values, batch_size=10000, **_filter):
+        """
+        Like :py:meth:`find_many()`, but return only the first row (by primary
+        key) for each value - for looking up rows by a unique column.
+        ::
+            rows = table.get_many("id", ids)
+            row = rows.get(42)
+        """
+        rows = self.find_many(column, values, batch_size=batch_size, **_filter)
+        return OrderedDict((v, r[0]) for v, r in rows.items())
+
     def _args_to_order_by(self, order_by):
         if order_by[0] == "-":
             return self.table.c[order_by[1:]].desc()
         else:
             return self.table.c[order_by].asc()
 
+    def _keyset_columns(self, order_by, force=False):
+        """
+        Return the columns (and direction) to use for keyset pagination of the
+        given ``order_by`` list, or None if the ordering is not suitable.
+        Keyset pagination requires a single sort direction, not null sort
+        columns and a unique key - the primary key is appended to the sort
+        columns as a tie breaker. Unless ``force`` is set, the sort columns
+        must also lead an index or the primary key.
+        """
+        names = [o[1:] if o.startswith("-") else o for o in order_by]
+        desc = set(o.startswith("-") for o in order_by)
+        pk = self.primary_key
+        if len(desc) > 1:
+            return None
+        desc = desc.pop() if desc else False
+        if not names:
+            names = pk
+        if not names:
+            return None
+        if not force:
+            leading = [pk] + [[c.name for c in i.columns] for i in self.table.indexes]
+            if not any(cols[: len(names)] == names for cols in leading):
+                return None
+        if any(self.table.c[n].nullable for n in names if n not in pk):
+            return None
+        unique = [pk] + [
+            [c.name for c in i.columns] for i in self.table.indexes if i.unique
+        ]
+        if not any(cols and set(cols) <= set(names) for cols in unique):
+            if not pk:
+                return None
+            names = names + [c for c in pk if c not in names]
+        return [self.table.c[n] for n in names], desc
+
+    def _keyset_pages(self, args, columns, desc, limit, offset, step):
+        """Generate pages of results, seeking past the last key of each page
+        """
+        order_by = [c.desc() if desc else c.asc() for c in columns]
+        last = None
+        while limit is None or limit > 0:
+            qlimit = step if limit is None else min(step, limit)
+            whereclause = args
+            if last is not None:
+                if desc:
+                    seek = tuple_(*columns) < tuple_(*last)
+                else:
+                    seek = tuple_(*columns) > tuple_(*last)
+                whereclause = and_(args, seek)
+            q = self.table.select(
+                whereclause=whereclause,
+                limit=qlimit,
+                offset=offset if last is None else None,
+                order_by=order_by,
+            )
+            page = _Page(self.engine.execute(q))
+            yield page
+            if len(page.rows) < qlimit:
+                break
+            last = [page.rows[-1][c.name] for c in columns]
+            if limit is not None:
+                limit = limit - qlimit
+
+    def _offset_pages(self, args, order_by, limit, offset, step):
+        """Generate pages of results with LIMIT/OFFSET
+        """
+        for i in count():
+            qlimit = step if limit is None else min(limit - (step * i), step)
+            if qlimit <= 0:
+                break
+            q = self.table.select(
+                whereclause=args,
+                limit=qlimit,
+                offset=offset + (step * i),
+                order_by=order_by,
+            )
+            page = _Page(self.engine.execute(q))
+            yield page
+            if len(page.rows) < qlimit:
+                break
+
     def find(
         self,
         _limit=None,
         _offset=0,
         _step=5000,
+        _keyset=None,
+        _stream=False,
+        _as_columns=False,
         order_by="id",
         return_count=False,
         **_filter
@@ -324,6 +904,16 @@ class Table(object):
         By default :py:meth:`find() <dataset.Table.find>` will break the
         query into chunks of ``_step`` rows to prevent huge tables
         from being loaded into memory at once.
+        When the sort columns (or the primary key, if no valid sort columns
+        are given) are indexed, chunks are fetched with keyset pagination,
+        seeking past the last row of the previous chunk rather than using
+        OFFSET. Force this with ``_keyset=True`` or disable it with
+        ``_keyset=False``.
+        With ``_stream=True`` a single query is run through a server side
+        cursor and rows are fetched in batches of ``_step``, so memory use
+        stays flat regardless of the number of rows returned.
+        With ``_as_columns=True`` (or ``"numpy"``/``"arrow"``) the results
+        are returned as columns, see :py:meth:`db.query_columns()`.
         For more complex queries, please use :py:meth:`db.query()`
         instead."""
         self._check_dropped()
@@ -334,54 +924,142 @@ class Table(object):
             for o in order_by
             if (o.startswith("-") and o[1:] or o) in self.table.columns
         ]
-        order_by = [self._args_to_order_by(o) for o in order_by]
 
         args = self._args_to_clause(_filter)
 
-        # query total number of rows first
-        count_query = alias(
-            self.table.select(whereclause=args, limit=_limit, offset=_offset),
-            name="count_query_alias",
-        ).count()
-        rp = self.engine.execute(count_query)
-        total_row_count = rp.fetchone()[0]
         if return_count:
-            return total_row_count
-
-        if _limit is None:
-            _limit = total_row_count
-
-        if _step is None or _step is False or _step == 0:
-            _step = total_row_count
+            count_query = expression.select([func.count()]).select_from(
+                alias(
+                    self.table.select(whereclause=args, limit=_limit, offset=_offset),
+                    name="count_query_alias",
+                )
+            )
+            rp = self.engine.execute(count_query)
+            return rp.fetchone()[0]
 
-        if total_row_count > _step and not order_by:
-            _step = total_row_count
-            log.warn(
-                "query cannot be broken into smaller sections because it is unordered"
+        if _as_columns:
+            q = self.table.select(
+                whereclause=args,
+                limit=_limit,
+                offset=_offset,
+                order_by=[self._args_to_order_by(o) for o in order_by],
+            )
+            backend = "numpy" if _as_columns is True else _as_columns
+            return self.db.query_columns(
+                q, backend=backend, batch_size=_step or 10000
             )
 
-        queries = []
+        if _stream:
+            q = self.table.select(
+                whereclause=args,
+                limit=_limit,
+                offset=_offset,
+                order_by=[self._args_to_order_by(o) for o in order_by],
+            )
+            return ResultIter(
+                self.db.stream_engine(_step).execute(q),
+                row_type=self.db.row_type,
+                batch_size=_step or None,
+            )
 
-        for i in count():
-            qoffset = _offset + (_step * i)
-            qlimit = min(_limit - (_step * i), _step)
-            if qlimit <= 0:
-                break
-            queries.append(
-                self.table.select(
-                    whereclause=args, limit=qlimit, offset=qoffset, order_by=order_by
+        keyset = None
+        if _keyset is not False:
+            keyset = self._keyset_columns(order_by, force=_keyset)
+            if keyset is None and _keyset:
+                raise ValueError(
+                    "keyset pagination requires a unique, not null sort key "
+                    "with a single sort direction"
                 )
+
+        if _step and keyset:
+            columns, desc = keyset
+            pages = self._keyset_pages(args, columns, desc, _limit, _offset, _step)
+        elif _step and order_by:
+            order_by = [self._args_to_order_by(o) for o in order_by]
+            pages = self._offset_pages(args, order_by, _limit, _offset, _step)
+        else:
+            # unordered queries cannot be broken into smaller sections
+            q = self.table.select(
+                whereclause=args,
+                limit=_limit,
+                offset=_offset,
+                order_by=[self._args_to_order_by(o) for o in order_by],
             )
-        return ResultIter(
-            (self.engine.execute(q) for q in queries), row_type=self.db.row_type
-        )
+            pages = self.engine.execute(q)
+        return ResultIter(pages, row_type=self.db.row_type)
 
-    def count(self, **_filter):
+    def count(self, estimate=False, **_filter):
         """
         Return the count of results for the given filter set
         (same filter options as with ``find()``).
+
+        With ``estimate=True`` no rows are counted: the count of an unfiltered
+        table is read from the statistics (``pg_class.reltuples``), the count
+        of a filtered query is the planner's estimate from EXPLAIN.
+
+        Exact counts are cached until the table is written to, through pgdata
+        or as reported by ``pg_stat_user_tables``. Its counters are updated a
+        few seconds after other sessions commit, a count made in between may
+        be stale.
+        """
+        self._check_dropped()
+        if estimate:
+            if _filter:
+                return self._estimate(self.table.select(self._args_to_clause(_filter)))
+            return self._estimate()
+        try:
+            key = (self.schema, self.name, frozenset(_filter.items()))
+            hash(key)
+        except TypeError:
+            # unhashable filter values (lists), count without caching
+            return self.find(return_count=True, **_filter)
+        signature = self._write_signature()
+        with self.db._counts_lock:
+            cached = self.db._counts.get(key)
+        if cached and signature is not None and cached[0] == signature:
+            return cached[1]
+        n = self.find(return_count=True, **_filter)
+        if signature is not None:
+            with self.db._counts_lock:
+                self.db._counts[key] = (signature, n)
+                if len(self.db._counts) > 1000:
+                    self.db._counts.popitem(last=False)
+        return n
+
+    def _regclass(self):
+        return self.engine.dialect.identifier_preparer.format_table(self.table)
+
+    def _write_signature(self):
+        """
+        Return the write statistics of the table, which change whenever rows
+        are added or removed (None for views and other relations without
+        statistics)
+        """
+        sql = """SELECT n_live_tup, n_tup_ins, n_tup_del, n_mod_since_analyze
+                 FROM pg_stat_user_tables
+                 WHERE relid = %s::regclass"""
+        row = self.engine.execute(sql, (self._regclass(),)).fetchone()
+        if row is not None:
+            return tuple(row)
+
+    def _estimate(self, query=None):
+        """Estimated row count of the table, or of a select
         """
-        return self.find(return_count=True, **_filter)
+        if query is None:
+            sql = """SELECT c.reltuples::bigint, s.n_live_tup
+                     FROM pg_class c
+                     LEFT OUTER JOIN pg_stat_user_tables s ON c.oid = s.relid
+                     WHERE c.oid = %s::regclass"""
+            reltuples, live = self.engine.execute(sql, (self._regclass(),)).fetchone()
+            # reltuples is -1 (0 before PostgreSQL 14) if never analyzed
+            if reltuples < 0 or (reltuples == 0 and live):
+                return live or 0
+            return reltuples
+        compiled = query.compile(dialect=self.engine.dialect)
+        plan = self.engine.execute(
+            "EXPLAIN (FORMAT JSON) " + six.text_type(compiled), compiled.params
+        ).fetchone()[0]
+        return int(plan[0]["Plan"]["Plan Rows"])
 
     def __getitem__(self, item):
         """
@@ -0,0 +1,277 @@
+from __future__ import absolute_import
+import logging
+import math
+from hashlib import sha1
+
+import six
+
+log = logging.getLogger(__name__)
+
+
+# extent of British Columbia in BC Albers (EPSG:3005), the projection
+# ogr2pg and pg2ogr default to
+BC_EXTENT = (159587.5, 173787.5, 1881187.5, 1748187.5)
+
+
+class Tiles(object):
+    """
+    A grid of tiles stored in ``table``, for running a query tile by tile
+    with :py:meth:`run()`, in parallel and resumably.
+
+    If ``table`` does not exist, it is created with a regular grid of
+    ``size`` units square tiles covering ``extent`` (xmin, ymin, xmax, ymax,
+    in ``srid`` coordinates), as columns ``tile_id``, ``x_min``, ``y_min``,
+    ``x_max``, ``y_max`` and ``srid`` (xmin and xmax are system columns).
+    If it exists, its grid must match ``extent``, ``srid`` and ``size``.
+    By default the table is ``public.pgdata_tiles_<hash>``, named after the
+    grid. An existing table of tile polygons can be used instead by naming
+    its ``id_column`` and ``geom_column``.
+
+    Tiles finished by each job are recorded in the table ``<table>_done``.
+    """
+
+    def __init__(
+        self,
+        db,
+        table=None,
+        extent=BC_EXTENT,
+        srid=3005,
+        size=100000,
+        id_column="tile_id",
+        geom_column=None,
+    ):
+        self.db = db
+        if geom_column:
+            if table is None:
+                raise ValueError("A table is required with geom_column")
+            self.grid = (table, id_column, geom_column)
+        else:
+            self.grid = (tuple(float(v) for v in extent), srid, float(size))
+        if table is None:
+            key = repr(self.grid).encode("utf-8")
+            table = "public.pgdata_tiles_" + sha1(key).hexdigest()[:12]
+        self.schema, self.name = db.parse_table_name(table)
+        self.schema = self.schema or db.schema or "public"
+        self.id_column = id_column
+        self.geom_column = geom_column
+        preparer = db.engine.dialect.identifier_preparer
+        self.table = preparer.quote(self.schema) + "." + preparer.quote(self.name)
+        self.done_table = (
+            preparer.quote(self.schema) + "." + preparer.quote(self.name + "_done")
+        )
+        if not db.catalog.has_table(self.schema, self.name):
+            if geom_column:
+                raise ValueError("Tile table %s does not exist" % table)
+            self.create(extent, srid, size)
+        elif not geom_column:
+            self._check_grid(extent, srid, size)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS {t} (
+                 job text NOT NULL,
+                 tile_id text NOT NULL,
+                 rowcount bigint,
+                 elapsed double precision,
+                 finished_at timestamp with time zone DEFAULT now(),
+                 PRIMARY KEY (job, tile_id))""".format(
+                t=self.done_table
+            )
+        )
+
+    def _check_grid(self, extent, srid, size):
+        """Raise a ValueError if the existing grid is not the one asked for
+        """
+        xmin, ymin, xmax, ymax = extent
+        columns = int(math.ceil((xmax - xmin) / float(size)))
+        rows = int(math.ceil((ymax - ymin) / float(size)))
+        expected = (
+            rows * columns,
+            xmin,
+            ymin,
+            xmin + (columns - 1) * size + size,
+            ymin + (rows - 1) * size + size,
+            xmin + size,
+            srid,
+            srid,
+        )
+        sql = """SELECT count(*), min(x_min), min(y_min), max(x_max), max(y_max),
+                   min(x_max), min(srid), max(srid)
+                 FROM {t}""".format(
+            t=self.table
+        )
+        found = tuple(self.db.query_one(sql))
+        if found != expected:
+            raise ValueError(
+                "Tile table %s does not hold a grid of %s tiles over %s in "
+                "srid %s, drop it or use another table"
+                % (self.table, size, extent, srid)
+            )
+
+    def create(self, extent, srid, size):
+        """
+        Create the tile table with a grid of ``size`` tiles over ``extent``,
+        dropping the tiles recorded as done in a previous grid
+        """
+        xmin, ymin, xmax, ymax = extent
+        columns = int(math.ceil((xmax - xmin) / float(size)))
+        rows = int(math.ceil((ymax - ymin) / float(size)))
+        self.db.execute("DROP TABLE IF EXISTS {t}".format(t=self.done_table))
+        tiles = []
+        for row in range(rows):
+            for column in range(columns):
+                x = xmin + column * size
+                y = ymin + row * size
+                tiles.append(
+                    {
+                        "tile_id": row * columns + column + 1,
+                        "xmin": x,
+                        "ymin": y,
+                        "xmax": x + size,
+                        "ymax": y + size,
+                        "srid": srid,
+                    }
+                )
+        self.db.execute(
+            """CREATE TABLE {t} (
+                 tile_id integer PRIMARY KEY,
+                 x_min double precision,
+                 y_min double precision,
+                 x_max double precision,
+                 y_max double precision,
+                 srid integer)""".format(
+                t=self.table
+            )
+        )
+        self.db.execute_many(
+            """INSERT INTO {t} (tile_id, x_min, y_min, x_max, y_max, srid)
+               VALUES (%(tile_id)s, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, %(srid)s)
+            """.format(
+                t=self.table
+            ),
+            tiles,
+        )
+        log.info("created %s tiles in %s", len(tiles), self.table)
+
+    def all(self):
+        """
+        Return all tiles, as dicts with keys ``tile_id``, ``xmin``, ``ymin``,
+        ``xmax``, ``ymax``, ``srid`` and ``tile``, the sql of the tile
+        geometry
+        """
+        if self.geom_column:
+            sql = """SELECT {i} AS tile_id,
+                       ST_XMin({g}) AS xmin, ST_YMin({g}) AS ymin,
+                       ST_XMax({g}) AS xmax, ST_YMax({g}) AS ymax,
+                       ST_SRID({g}) AS srid
+                     FROM {t} ORDER BY {i}""".format(
+                i=self.id_column, g=self.geom_column, t=self.table
+            )
+        else:
+            sql = """SELECT tile_id, x_min AS xmin, y_min AS ymin,
+                       x_max AS xmax, y_max AS ymax, srid
+                     FROM {t} ORDER BY tile_id""".format(
+                t=self.table
+            )
+        tiles = []
+        for row in self.db.query(sql).fetchall():
+            tile = dict(row.items())
+            if self.geom_column:
+                tile["tile"] = "(SELECT {g} FROM {t} WHERE {i} = {v})".format(
+                    g=self.geom_column,
+                    t=self.table,
+                    i=self.id_column,
+                    v=self.db._literal(tile["tile_id"]),
+                )
+            else:
+                tile["tile"] = (
+                    "ST_MakeEnvelope({xmin}, {ymin}, {xmax}, {ymax}, {srid})".format(
+                        **tile
+                    )
+                )
+            tiles.append(tile)
+        return tiles
+
+    def done(self, job):
+        """Return the ids (as text) of the tiles finished by ``job``
+        """
+        sql = "SELECT tile_id FROM {t} WHERE job = %s".format(t=self.done_table)
+        return set(r[0] for r in self.db.query(sql, (job,)).fetchall())
+
+    def reset(self, job):
+        """Forget the tiles finished by ``job``, to run it again from scratch
+        """
+        self.db.execute(
+            "DELETE FROM {t} WHERE job = %s".format(t=self.done_table), (job,)
+        )
+
+    def run(
+        self,
+        sql,
+        target=None,
+        job=None,
+        workers=4,
+        lookup=None,
+        resume=True,
+        processes=False,
+        progress=None,
+    ):
+        """
+        Run a query (a name in ``db.queries`` or a sql string) once per
+        tile, ``workers`` tiles at a time (see
+        :py:meth:`Database.parallel_execute() <pgdata.Database.parallel_execute>`).
+        In the query, ``$tile`` is replaced by the tile geometry and the
+        tile's ``%(tile_id)s``, ``%(xmin)s``, ``%(ymin)s``, ``%(xmax)s``,
+        ``%(ymax)s`` and ``%(srid)s`` are available as parameters.
+        ::
+            tiles = db.tiles()
+            tiles.run(
+                '''SELECT id, ST_ClipByBox2D(geom, $tile) AS geom
+                   FROM whse.streams
+                   WHERE ST_Intersects(geom, $tile)''',
+                target="temp.streams_tiled",
+                workers=8)
+
+        With ``target`` (a table name or Table), ``sql`` is a SELECT whose
+        results are inserted into the target (matching its columns in
+        order), otherwise it is a complete statement.
+
+        Each tile is recorded as finished in the same transaction as its
+        results, under the name ``job`` (by default derived from the sql,
+        target and grid). With ``resume`` set, tiles already finished by the job
+        are skipped, so an interrupted run picks up where it stopped.
+
+        Returns the results of the tiles run, see parallel_execute.
+        """
+        if sql in self.db.queries:
+            sql = self.db.queries[sql]
+        if target is not None:
+            if not isinstance(target, six.string_types):
+                target = target._regclass()
+            sql = "INSERT INTO {t} {q}".format(t=target, q=sql)
+        if job is None:
+            key = sql + repr(sorted((lookup or {}).items())) + repr(self.grid)
+            job = sha1(key.encode("utf-8")).hexdigest()[:16]
+        if not resume:
+            self.reset(job)
+        done = self.done(job)
+        tiles = [
+            dict(t, job=job)
+            for t in self.all()
+            if six.text_type(t["tile_id"]) not in done
+        ]
+        log.info(
+            "job %s: %s tiles to run, %s already done", job, len(tiles), len(done)
+        )
+        after = """INSERT INTO {t} (job, tile_id, rowcount, elapsed)
+                   VALUES (%(job)s, %(tile_id)s::text, %(rowcount)s, %(elapsed)s)
+                """.format(
+            t=self.done_table
+        )
+        return self.db.parallel_execute(
+            sql,
+            tiles,
+            workers=workers,
+            lookup=lookup,
+            processes=processes,
+            progress=progress,
+            after=after,
+        )
@@ -1,8 +1,12 @@
 from __future__ import absolute_import
 from collections import OrderedDict
+from collections import namedtuple
+from functools import lru_cache
 from six import string_types
 from inspect import isgenerator
-import pkg_resources
+import binascii
+import json
+import re
 import os
 import six
 
@@ -14,43 +18,184 @@ except ImportError:
 
 row_type = OrderedDict
 
+# sql files shipped with pgdata
+SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+
+# compact alternative row type: a tuple subclass generated per set of columns
+RECORD = "record"
+
+
+_PLACEHOLDER = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)")
+
+
+class QueryTemplate(object):
+    """
+    A sql string with ``$placeholders``, parsed once so that it can be
+    rendered repeatedly with a single pass over the string.
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+        # alternating literal sql and placeholder names
+        self._parts = _PLACEHOLDER.split(sql)
+        self.placeholders = set(self._parts[1::2])
+
+    def _value(self, name, lookup):
+        if name in lookup:
+            return six.text_type(lookup[name])
+        # like str.replace, a key may match the start of a longer placeholder
+        for key in sorted(lookup, key=len, reverse=True):
+            if name.startswith(key):
+                return six.text_type(lookup[key]) + name[len(key) :]
+        return "$" + name
+
+    def render(self, lookup):
+        """Return the sql with placeholders replaced by values in ``lookup``
+        """
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = self._value(parts[i], lookup)
+        return "".join(parts)
+
+
+# a statement (after any comments) starting with one of these keywords, or a
+# SELECT ... INTO, may change the catalog
+_DDL = re.compile(
+    r"(?:^|;)(?:\s|--[^\n]*(?:\n|$)|/\*.*?\*/)*"
+    r"(?:(?:CREATE|ALTER|DROP|TRUNCATE|COMMENT)\b|SELECT\b[^;]*\bINTO\b)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def is_ddl(sql):
+    """
+    Check if sql (a string or a SQLAlchemy statement) contains a DDL
+    statement - CREATE, ALTER, DROP, TRUNCATE, COMMENT or SELECT ... INTO
+    """
+    if not isinstance(sql, string_types):
+        from sqlalchemy.sql.ddl import DDLElement
+
+        if isinstance(sql, DDLElement):
+            return True
+        sql = getattr(sql, "text", "")
+    return _DDL.search(sql) is not None
+
+
+# read only statements start (after any comments) with one of these keywords
+_READ = re.compile(
+    r"(?:\s|--[^\n]*(?:\n|$)|/\*.*?\*/)*(?:SELECT|VALUES|TABLE|SHOW|EXPLAIN|WITH)\b",
+    re.IGNORECASE | re.DOTALL,
+)
+_WRITE = re.compile(r"\b(?:INSERT|UPDATE|DELETE|MERGE|COPY|ANALYZE)\b", re.IGNORECASE)
+
+
+def is_write(sql):
+    """
+    Check if sql (a string or a SQLAlchemy statement) may write to tables:
+    anything but a single SELECT, VALUES, TABLE, SHOW, EXPLAIN or WITH
+    query that does not mention a data modifying keyword. A read only
+    query mentioning one (eg in a string literal) is reported as a write,
+    writes made by functions called from a query are not detected.
+    """
+    if not isinstance(sql, string_types):
+        from sqlalchemy.sql.expression import SelectBase
+
+        if isinstance(sql, SelectBase):
+            return False
+        if not hasattr(sql, "text"):
+            return True
+        sql = sql.text
+    sql = sql.strip().rstrip(";")
+    if not _READ.match(sql) or is_ddl(sql):
+        return True
+    return ";" in sql or _WRITE.search(sql) is not None
+
+
+@lru_cache(maxsize=256)
+def compile_query(sql):
+    """Return the (cached) QueryTemplate for a sql string
+    """
+    return QueryTemplate(sql)
+
 
 class QueryDict(object):
     """Provide a dict like interface to files in the /sql folder
+
+    Each file is read once and cached, it is read again only if it has
+    been modified.
     """
 
+    # number of sql strings remembered for name_of()
+    max_names = 1000
+
     def __init__(self, path=None):
-        self.queries = None
+        self.queries = {}
         self.path = path
+        self._names = OrderedDict()
 
-    def __getitem__(self, query_name):
+    def _filename(self, query_name):
         # first, look in specified path
         # throw an error if provided a path and the file doesn't exist
         if self.path:
             filename = os.path.join(self.path, query_name + ".sql")
             if os.path.exists(filename):
-                with open(filename, "r") as f:
-                    return six.text_type(f.read())
+                return filename
             else:
                 raise ValueError("Invalid query path or name: %r" % query_name)
 
         # next, look in /sql folder in current working directory
         elif os.path.exists(os.path.join("sql", query_name + ".sql")):
-            filename = os.path.join("sql", query_name + ".sql")
-            with open(filename, "r") as f:
-                return six.text_type(f.read())
+            return os.path.join("sql", query_name + ".sql")
 
         # finally, look in the pgdata /sql folder
-        elif pkg_resources.resource_exists(
-            __name__, os.path.join("sql", query_name + ".sql")
-        ):
-            return pkg_resources.resource_string(
-                __name__, os.path.join("sql", query_name + ".sql")
-            ).decode("utf-8")
+        elif os.path.exists(os.path.join(SQL_PATH, query_name + ".sql")):
+            return os.path.join(SQL_PATH, query_name + ".sql")
 
         else:
             raise ValueError("Invalid query name: %r" % query_name)
 
+    def __getitem__(self, query_name):
+        cached = self.queries.get(query_name)
+        if cached:
+            filename, mtime, sql = cached
+            try:
+                if os.path.getmtime(filename) == mtime:
+                    return sql
+            except OSError:
+                pass
+        filename = self._filename(query_name)
+        mtime = os.path.getmtime(filename)
+        with open(filename, "r") as f:
+            sql = six.text_type(f.read())
+        self.queries[query_name] = (filename, mtime, sql)
+        self.register(sql, query_name)
+        return sql
+
+    def __contains__(self, query_name):
+        try:
+            self[query_name]
+            return True
+        except ValueError:
+            return False
+
+    def template(self, query_name):
+        """Return the compiled QueryTemplate of a query
+        """
+        return compile_query(self[query_name])
+
+    def register(self, sql, query_name):
+        """Remember that ``sql`` is (a rendering of) query ``query_name``
+        """
+        self._names[sql] = query_name
+        self._names.move_to_end(sql)
+        if len(self._names) > self.max_names:
+            self._names.popitem(last=False)
+
+    def name_of(self, sql):
+        """Return the name of the query a sql string was loaded from, or None
+        """
+        return self._names.get(sql)
+
 
 class DatasetException(Exception):
     pass
@@ -65,43 +210,263 @@ def normalize_column_name(name):
     return name
 
 
+def copy_escape(value):
+    """Escape a string for the postgres COPY text format
+    """
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _array_literal(value):
+    """Format a (nested) list as a postgres array literal
+    """
+    items = []
+    for v in value:
+        if v is None:
+            items.append("NULL")
+        elif isinstance(v, (list, tuple)):
+            items.append(_array_literal(v))
+        else:
+            if isinstance(v, bool):
+                v = "t" if v else "f"
+            v = six.text_type(v).replace("\\", "\\\\").replace('"', '\\"')
+            items.append('"' + v + '"')
+    return "{" + ",".join(items) + "}"
+
+
+def _ewkb_has_srid(wkb):
+    """Check the SRID flag of a (E)WKB geometry
+    """
+    if len(wkb) < 5:
+        return False
+    if wkb[0] == 1:
+        return bool(wkb[4] & 0x20)
+    return bool(wkb[1] & 0x20)
+
+
+def copy_converter(column_type):
+    """
+    Return a function converting python values to COPY text format values
+    for the given SQLAlchemy column type. Geometry columns accept WKB
+    (bytes), hex (E)WKB or (E)WKT strings and shapely-like objects.
+    """
+    type_name = type(column_type).__name__
+    if type_name in ("Geometry", "Geography"):
+        srid = getattr(column_type, "srid", -1) or -1
+
+        def convert(value):
+            if hasattr(value, "wkb"):
+                value = value.wkb
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                value = bytes(value)
+                hexwkb = binascii.hexlify(value).decode("ascii")
+                if srid > 0 and not _ewkb_has_srid(value):
+                    return "SRID=%s;%s" % (srid, hexwkb)
+                return hexwkb
+            value = six.text_type(value)
+            if srid > 0 and not value.startswith(("SRID=", "0")):
+                value = "SRID=%s;%s" % (srid, value)
+            return copy_escape(value)
+
+    elif type_name in ("JSON", "JSONB"):
+
+        def convert(value):
+            if not isinstance(value, string_types):
+                value = json.dumps(value)
+            return copy_escape(value)
+
+    elif type_name == "ARRAY":
+
+        def convert(value):
+            if isinstance(value, (list, tuple)):
+                value = _array_literal(value)
+            return copy_escape(value)
+
+    else:
+
+        def convert(value):
+            if isinstance(value, bool):
+                return "t" if value else "f"
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                value = "\\x" + binascii.hexlify(bytes(value)).decode("ascii")
+            elif isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            return copy_escape(six.text_type(value))
+
+    return convert
+
+
+def _numpy_column(np, values, binary=False):
+    if binary:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    array = np.array(values)
+    # fixed width bytes would drop trailing nulls, keep python objects instead
+    if array.dtype.kind == "S":
+        array = np.array(values, dtype=object)
+    return array
+
+
+def fetch_columns(cursor, batch_size=10000, backend="numpy", binary_oids=()):
+    """
+    Fetch all rows of an executed cursor in batches of ``batch_size``,
+    returning the columns as a dict of numpy arrays (``backend="numpy"``)
+    or as a pyarrow Table (``backend="arrow"``). Each batch is converted to
+    arrays as soon as it is fetched. Values of columns with a type oid in
+    ``binary_oids`` (eg geometries, which are received as hex EWKB) are
+    returned as WKB bytes.
+    """
+    if backend == "numpy":
+        import numpy as np
+    elif backend == "arrow":
+        import pyarrow as pa
+    else:
+        raise ValueError("Invalid backend: %r" % backend)
+
+    chunks = None
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if chunks is None:
+            # server side cursors describe the results only after a fetch
+            names = [d[0] for d in cursor.description]
+            binary = [d[1] in binary_oids for d in cursor.description]
+            chunks = [[] for n in names]
+        if not rows:
+            break
+        for i, values in enumerate(zip(*rows)):
+            if binary[i]:
+                values = [None if v is None else binascii.unhexlify(v) for v in values]
+            if backend == "numpy":
+                chunks[i].append(_numpy_column(np, values, binary[i]))
+            else:
+                chunks[i].append(
+                    pa.array(values, type=pa.binary() if binary[i] else None)
+                )
+        if len(rows) < batch_size:
+            break
+
+    if backend == "numpy":
+        return OrderedDict(
+            (n, np.concatenate(c) if c else _numpy_column(np, [], b))
+            for n, c, b in zip(names, chunks, binary)
+        )
+    arrays = []
+    for c, b in zip(chunks, binary):
+        # batches of nulls only have a null type, cast them to the column type
+        types = [a.type for a in c if a.type != pa.null()]
+        column_type = types[0] if types else (pa.binary() if b else pa.null())
+        arrays.append(pa.chunked_array([a.cast(column_type) for a in c], column_type))
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+@lru_cache(maxsize=256)
+def record_type(columns):
+    """
+    Return a record class for given tuple of column names: a namedtuple (no
+    per instance dict) whose values can also be looked up by column name.
+    Classes are cached, so there is one per distinct set of columns.
+    """
+    index = dict((k, i) for i, k in enumerate(columns))
+
+    class Record(namedtuple("Record", columns, rename=True)):
+        __slots__ = ()
+        _keys = columns
+        _index = index
+
+        def __getitem__(self, key):
+            if isinstance(key, string_types):
+                key = self._index[key]
+            return tuple.__getitem__(self, key)
+
+        def get(self, key, default=None):
+            if key in self._index:
+                return tuple.__getitem__(self, self._index[key])
+            return default
+
+        def keys(self):
+            return list(self._keys)
+
+        def items(self):
+            return list(zip(self._keys, self))
+
+    return Record
+
+
 def convert_row(row_type, row):
     if row is None:
         return None
-    return row_type(list(row.items()))
+    return convert_rows(row_type, list(row.keys()), [row])[0]
+
+
+def convert_rows(row_type, keys, rows):
+    """
+    Convert a batch of rows (with column names ``keys``) to ``row_type``:
+      - None: keep the SQLAlchemy rows as they are
+      - tuple: plain tuples
+      - RECORD: records, see record_type()
+      - otherwise a dict like type, built from (key, value) pairs
+    """
+    if row_type is None:
+        return rows
+    if row_type is tuple:
+        return [tuple(r) for r in rows]
+    if row_type == RECORD:
+        make = record_type(tuple(keys))._make
+        return [make(r) for r in rows]
+    return [row_type(zip(keys, r)) for r in rows]
 
 
 class ResultIter(object):
     """
     SQLAlchemy ResultProxies are not iterable to get a list of dictionaries.
     This is to wrap them.
+    If ``batch_size`` is given, rows are fetched from each result proxy in
+    batches of that size with ``fetchmany`` (to use with streaming results),
+    otherwise each result proxy is fetched in full. Rows are converted to
+    ``row_type`` a batch at a time (see convert_rows).
     """
 
-    def __init__(self, result_proxies, row_type=row_type):
+    def __init__(self, result_proxies, row_type=row_type, batch_size=None):
         self.row_type = row_type
+        self.batch_size = batch_size
         if not isgenerator(result_proxies):
             result_proxies = iter((result_proxies,))
         self.result_proxies = result_proxies
+        self._rp = None
         self._iter = None
 
     def _next_rp(self):
         try:
-            rp = next(self.result_proxies)
-            self.keys = list(rp.keys())
-            self._iter = iter(rp.fetchall())
+            self._rp = next(self.result_proxies)
+            self.keys = list(self._rp.keys())
             return True
         except StopIteration:
             return False
 
+    def _next_batch(self):
+        if self.batch_size:
+            rows = self._rp.fetchmany(self.batch_size)
+        else:
+            rows = self._rp.fetchall()
+        if not self.batch_size or len(rows) < self.batch_size:
+            self._rp = None
+        self._iter = iter(convert_rows(self.row_type, self.keys, rows))
+
     def __next__(self):
-        if self._iter is None:
-            if not self._next_rp():
+        while True:
+            if self._iter is not None:
+                try:
+                    return next(self._iter)
+                except StopIteration:
+                    self._iter = None
+            if self._rp is None and not self._next_rp():
                 raise StopIteration
-        try:
-            return convert_row(self.row_type, next(self._iter))
-        except StopIteration:
-            self._iter = None
-            return self.__next__()
+            self._next_batch()
 
     next = __next__
 
@@ -41,7 +41,10 @@ setup(name='pgdata',
       zip_safe=False,
       install_requires=read('requirements.txt').splitlines(),
       extras_require={
-        'test': ['pytest', 'coverage', 'fiona']},
+        'test': ['pytest', 'coverage', 'fiona'],
+        'columns': ['numpy', 'pyarrow'],
+        'async': ['psycopg', 'psycopg-pool'],
+        'zstd': ['zstandard']},
       entry_points="""
       [console_scripts]
       bc2pg=pgdata.cli:cli
@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import tempfile
@@ -55,6 +56,55 @@ class ogrpg(unittest.TestCase):
         assert 'physical_address' in airports.columns
         assert sum(1 for _ in airports.all()) == 1
 
+    def test_ogr2pg_many(self):
+        db = DB
+        jobs = [{"in_file": AIRPORTS, "in_layer": "bc_airports",
+                 "out_layer": "bc_airports_many", "schema": "pgdata"},
+                {"in_file": AIRPORTS_2, "in_layer": "bc_airports",
+                 "out_layer": "bc_airports_many", "schema": "pgdata", "append": True},
+                {"in_file": "does_not_exist.json", "schema": "pgdata"}]
+        results = db.ogr2pg_many(jobs, workers=2)
+        assert [r["returncode"] == 0 for r in results] == [True, True, False]
+        airports = db['pgdata.bc_airports_many']
+        assert sum(1 for _ in airports.all()) == 426
+
+    def test_ogr2pg_incremental(self):
+        db = DB
+        src = os.path.join(self.tempdir, 'bc_airports.json')
+        shutil.copy(AIRPORTS, src)
+        kwargs = dict(in_layer='bc_airports', out_layer='bc_airports_inc',
+                      schema='pgdata', fid='airport_fid', incremental=True)
+        assert db.ogr2pg(src, **kwargs) == {"status": "loaded", "rowcount": 425}
+        assert db.ogr2pg(src, **kwargs)["status"] == "skipped"
+        # touched but not modified
+        os.utime(src, None)
+        assert db.ogr2pg(src, **kwargs)["status"] == "skipped"
+        # drop the last feature, edit the first
+        with open(AIRPORTS) as f:
+            data = json.load(f)
+        data["features"] = data["features"][:-1]
+        data["features"][0]["properties"]["AIRPORT_NAME"] = "renamed"
+        with open(src, "w") as f:
+            json.dump(data, f)
+        result = db.ogr2pg(src, **kwargs)
+        assert result == {"status": "merged", "inserted": 0, "updated": 1,
+                          "deleted": 1, "rowcount": 424}
+        assert "bc_airports_inc_pgdata_stage" not in db.tables_in_schema("pgdata")
+
+    def test_ogr2pg_incremental_append(self):
+        db = DB
+        kwargs = dict(in_layer='bc_airports', out_layer='bc_airports_inc_append',
+                      schema='pgdata', fid='airport_fid', incremental=True)
+        assert db.ogr2pg(AIRPORTS, **kwargs)["rowcount"] == 425
+        # the fids of a second source are not unique in the table
+        try:
+            db.ogr2pg(AIRPORTS_2, append=True, **kwargs)
+            assert False, "an incremental append was run"
+        except ValueError:
+            pass
+        airports = db['pgdata.bc_airports_inc_append']
+        assert sum(1 for _ in airports.all()) == 425
+
     def test_pg2ogr_spaces(self):
         db = DB
         db.pg2ogr(sql='SELECT * from pgdata.bc_airports_spaced', driver='GeoJSON', outfile=os.path.join(self.spaced_dir, 'test_dump_spaced.json'))
@@ -87,6 +137,27 @@ class ogrpg(unittest.TestCase):
         layers = fiona.listlayers(os.path.join(self.tempdir, 'test_dump.gpkg'))
         assert len(layers) == 2
 
+    def test_pg2gpkg_parallel(self):
+        db = DB
+        outfile = os.path.join(self.tempdir, 'test_dump_parallel.gpkg')
+        db.pg2ogr(sql='SELECT * FROM pgdata.bc_airports', driver='GPKG',
+                  outfile=outfile, outlayer='bc_airports',
+                  split_key='ogc_fid', workers=3)
+        c = fiona.open(outfile, 'r')
+        assert len(c) == 425
+        fids = [f['properties']['ogc_fid'] for f in c]
+        assert fids == sorted(fids)
+
+    def test_pg2gpkg_parallel_null_key(self):
+        db = DB
+        outfile = os.path.join(self.tempdir, 'test_dump_parallel_null.gpkg')
+        sql = '''SELECT *, CASE WHEN ogc_fid > 10 THEN ogc_fid END AS k
+                 FROM pgdata.bc_airports'''
+        db.pg2ogr(sql=sql, driver='GPKG', outfile=outfile, outlayer='bc_airports',
+                  split_key='k', workers=3)
+        c = fiona.open(outfile, 'r')
+        assert len(c) == 425
+
     def test_pg2ogr_append(self):
         db = DB
         db.pg2ogr(sql='SELECT * FROM pgdata.bc_airports LIMIT 10', driver='GPKG',